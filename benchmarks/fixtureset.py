@@ -0,0 +1,211 @@
+import io
+import os
+import copy
+import json
+import random
+import string
+import zipfile
+from datetime import datetime, timedelta
+
+_fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class FixtureSet:
+
+    _industries = ["食料品", "化学", "機械", "電気機器", "情報・通信", "小売業", "建設業", "銀行業", "不動産業", "証券業"]
+    _research_analyses = ["割安", "妥当水準", "割高"]
+    _pick_diags = ["買い", "強気買い", "売り"]
+
+    def __init__(
+        self,
+        companies: int = 100,
+        days: int = 5,
+        start_date_str: str = "2024-06-24",
+        padding_bytes: int = 0,
+        fixture_dir: str = _fixture_dir,
+    ):
+        # 記録したレスポンスを雛形にして、会社数・日数を増やした応答を作る
+        self._companies = companies
+        self._days = days
+        self._start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        self._padding = "見本" * (padding_bytes // 6)
+
+        with open(os.path.join(fixture_dir, "documents.json"), "r", encoding="utf-8") as f:
+            self._documents = json.load(f)
+        with open(os.path.join(fixture_dir, "filing.xbrl"), "r", encoding="utf-8") as f:
+            self._xbrl_template = string.Template(f.read())
+        with open(os.path.join(fixture_dir, "filing.csv"), "r", encoding="utf-8") as f:
+            self._csv_template = string.Template(f.read())
+        with open(os.path.join(fixture_dir, "yahoo_search.html"), "r", encoding="utf-8") as f:
+            self._yahoo_template = string.Template(f.read())
+        with open(os.path.join(fixture_dir, "minkabu_stock.html"), "r", encoding="utf-8") as f:
+            self._minkabu_template = string.Template(f.read())
+
+    def get_dates(self) -> list[str]:
+        return [(self._start_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(self._days)]
+
+    def get_company_count(self) -> int:
+        return self._companies
+
+    def get_company(self, index: int) -> dict:
+
+        # 会社毎に決まった値 (実行毎に同じ)
+        rng = random.Random(index)
+        issued_shares = rng.randint(5, 50) * 1000000
+        stock_price = float(rng.randint(300, 5000))
+        eps = round(stock_price / rng.uniform(4.0, 25.0), 2)
+        current_assets = int(issued_shares * stock_price * rng.uniform(0.3, 2.0))
+        return {
+            "index": index,
+            "doc_id": f"S1{index:06d}",
+            "edinet_code": f"E{10000 + index:05d}",
+            "sec_code": f"{1300 + index:04d}0",
+            "company_code": f"{1300 + index:04d}",
+            "ticker": f"{1300 + index:04d}.T",
+            "company_name": f"見本{index:04d}株式会社",
+            "date": self.get_dates()[index % self._days],
+            "issued_shares": issued_shares,
+            "stock_price": stock_price,
+            "aggregate_market_value": int(issued_shares * stock_price / 1000000),
+            "target_price": round(stock_price * rng.uniform(0.8, 1.5)),
+            "current_assets": current_assets,
+            "prior_current_assets": int(current_assets * rng.uniform(0.8, 1.2)),
+            "investment_securities": int(current_assets * rng.uniform(0.0, 0.5)),
+            "liabilities": int(current_assets * rng.uniform(0.3, 1.2)),
+            "employees": rng.randint(50, 5000),
+            "employees_consolidated": rng.randint(5000, 20000),
+            "average_salary": rng.randint(400, 1200) * 10000,
+            "board_member_reward": rng.randint(50, 800) * 1000000,
+            "board_member_count": rng.randint(3, 15),
+            "eps": eps,
+            "prior_eps": round(eps * rng.uniform(0.7, 1.3), 2),
+            "industry_name": rng.choice(self._industries),
+            "research_analysis": rng.choice(self._research_analyses),
+            "pick_diag": rng.choice(self._pick_diags),
+            "padding": self._padding,
+        }
+
+    def _find_index(self, key: str, value: str) -> int | None:
+
+        # 識別子は番号から作っているので逆算する (会社数が多くても線形探索しない)
+        try:
+            if key == "doc_id":
+                index = int(value[2:]) if value.startswith("S1") else -1
+            elif key == "company_code":
+                index = int(value) - 1300
+            elif key == "ticker":
+                index = int(value.split(".")[0]) - 1300
+            else:
+                raise ValueError(key)
+        except ValueError:
+            return None
+        if index < 0 or index >= self._companies or self.get_company(index)[key] != value:
+            return None
+        return index
+
+    def get_documents_json(self, date_str: str) -> bytes:
+
+        # 有価証券報告書は雛形の1件目、それ以外の書類はそのまま混ぜる
+        template, others = self._documents["results"][0], self._documents["results"][1:]
+        results = []
+        for index in range(self._companies):
+            company = self.get_company(index)
+            if company["date"] != date_str:
+                continue
+            document = copy.deepcopy(template)
+            document["docID"] = company["doc_id"]
+            document["edinetCode"] = company["edinet_code"]
+            document["secCode"] = company["sec_code"]
+            document["filerName"] = company["company_name"]
+            document["submitDateTime"] = date_str + " 09:00"
+            results.append(document)
+        for document in others:
+            document = copy.deepcopy(document)
+            document["docID"] = document["docID"] + date_str.replace("-", "")[-4:]
+            results.append(document)
+        for seq_number, document in enumerate(results, 1):
+            document["seqNumber"] = seq_number
+
+        data = copy.deepcopy(self._documents)
+        data["metadata"]["parameter"]["date"] = date_str
+        data["metadata"]["resultset"]["count"] = len(results)
+        data["results"] = results
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def get_xbrl(self, index: int) -> bytes:
+        return self._xbrl_template.substitute(self.get_company(index)).encode("utf-8")
+
+    def get_csv(self, index: int) -> bytes:
+        return self._csv_template.substitute(self.get_company(index)).encode("utf-16")
+
+    def get_zip(self, doc_id: str, doc_type: int) -> bytes | None:
+
+        # EDINETと同じ構成のzip (本文の他に監査報告書も含む)
+        index = self._find_index("doc_id", doc_id)
+        if index is None:
+            return None
+        company = self.get_company(index)
+        base_name = f"jpcrp030000-asr-001_{company['edinet_code']}-000_2024-03-31_01_2024-06-27"
+        audit_name = f"jpaud-aar-cn-001_{company['edinet_code']}-000_2024-03-31_01_2024-06-27"
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            if doc_type == 5:
+                zf.writestr(f"XBRL_TO_CSV/{audit_name}.csv", "要素ID\t値\n".encode("utf-16"))
+                zf.writestr(f"XBRL_TO_CSV/{base_name}.csv", self.get_csv(index))
+            else:
+                zf.writestr(f"XBRL/AuditDoc/{audit_name}.xbrl", b'<?xml version="1.0" encoding="UTF-8"?><xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"/>')
+                zf.writestr(f"XBRL/PublicDoc/{base_name}.xbrl", self.get_xbrl(index))
+                zf.writestr(f"XBRL/PublicDoc/0101010_honbun_{base_name}_ixbrl.htm", company["padding"].encode("utf-8"))
+        return buffer.getvalue()
+
+    def get_yahoo_search(self, query: str) -> bytes:
+
+        # 該当が無ければ結果0件のページ (一覧は空)
+        digits = "".join(character for character in query if character.isdigit())
+        index = int(digits) if 0 < len(digits) <= 6 else None
+        if index is None or index >= self._companies or not query in self.get_company(index)["company_name"]:
+            values = {key: "" for key in ["ticker", "company_name", "stock_price", "aggregate_market_value", "padding"]}
+            html = self._yahoo_template.substitute(values, query=query)
+            return html.replace('class="_1WbkBLD0"', "").encode("utf-8")
+        company = self.get_company(index)
+        values = dict(company, stock_price=f"{company['stock_price']:,.0f}", aggregate_market_value=f"{company['aggregate_market_value']:,}")
+        return self._yahoo_template.substitute(values, query=query).encode("utf-8")
+
+    def get_minkabu(self, company_code: str) -> bytes | None:
+        index = self._find_index("company_code", company_code)
+        if index is None:
+            return None
+        company = self.get_company(index)
+        return self._minkabu_template.substitute(company, target_price=f"{company['target_price']:,}").encode("utf-8")
+
+    def get_price_history(self, tickers: list[str], start_date_str: str, end_date_str: str) -> list[dict]:
+
+        # 平日のみ、会社毎に決まった値動き (yfinanceの縦持ちと同じ列)
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+        rows = []
+        for ticker in tickers:
+            index = self._find_index("ticker", ticker)
+            if index is None:
+                continue
+            base_price = self.get_company(index)["stock_price"]
+            current_date = start_date
+            while current_date <= end_date:
+                if current_date.weekday() < 5:
+                    rng = random.Random(f"{ticker}{current_date.toordinal()}")
+                    close = round(base_price * (1.0 + 0.1 * ((current_date.toordinal() % 60) / 60.0 - 0.5)) * rng.uniform(0.98, 1.02), 1)
+                    rows.append(
+                        {
+                            "ticker": ticker,
+                            "date": current_date.strftime("%Y-%m-%d"),
+                            "open": close,
+                            "high": close * 1.01,
+                            "low": close * 0.99,
+                            "close": close,
+                            "adj_close": close,
+                            "volume": float(rng.randint(10000, 1000000)),
+                        }
+                    )
+                current_date += timedelta(days=1)
+        return rows
@@ -0,0 +1,242 @@
+import gc
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import urllib.request
+import pandas as pd
+from datetime import datetime
+from typing import Callable
+
+# リポジトリ直下から python -m benchmarks.run で実行する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as app
+from lib import EdinetApiWrapper
+from lib import XBRLParserWrapper
+from lib import XBRLParallelParser
+from lib import YahooFinanceJPWrapper
+from lib import YahooFinanceWrapper
+from lib import MinkabuWrapper
+from lib import HttpClient
+from lib import PriceHistoryStore
+from lib import Metrics
+from .fixtureset import FixtureSet
+from .standinserver import StandInServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class FixtureYahooFinanceWrapper(YahooFinanceWrapper):
+
+    # yfinanceは取得先を差し替えられないので、株価の履歴は記録データから返す
+    def __init__(self, price_store: PriceHistoryStore, fixture_set: FixtureSet, latency_seconds: float):
+        super().__init__(price_store)
+        self._fixture_set = fixture_set
+        self._latency_seconds = latency_seconds
+
+    def _download_history(self, tickers: list[str], start_date_str: str, end_date_str: str) -> pd.DataFrame:
+        time.sleep(self._latency_seconds)
+        columns = ["ticker", "date", "open", "high", "low", "close", "adj_close", "volume"]
+        return pd.DataFrame(self._fixture_set.get_price_history(tickers, start_date_str, end_date_str), columns=columns)
+
+
+class BenchmarkRunner:
+
+    def __init__(self, fixture_set: FixtureSet, base_url: str, work_dir: str, latency_seconds: float, max_workers: int, trace_memory: bool):
+        self._fixture_set = fixture_set
+        self._base_url = base_url
+        self._work_dir = work_dir
+        self._latency_seconds = latency_seconds
+        self._max_workers = max_workers
+        self._trace_memory = trace_memory
+        self._results: list[dict] = []
+
+    def get_results(self) -> list[dict]:
+        return self._results
+
+    def _measure(self, name: str, unit: str, func: Callable[[], int]):
+
+        # func は処理した件数を返す
+        gc.collect()
+        if self._trace_memory:
+            tracemalloc.reset_peak()
+        stdout = io.StringIO()
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(stdout):
+            count = func()
+        elapsed_seconds = time.perf_counter() - start_time
+
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if self._trace_memory else float("nan")
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else float("nan")
+        result = {
+            "name": name,
+            "count": count,
+            "seconds": elapsed_seconds,
+            "throughput": count / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+            "unit": unit,
+            "peak_traced_mb": peak_mb,
+            "max_rss_mb": max_rss_mb,
+        }
+        self._results.append(result)
+        print(f"{name:<28} {count:>6} in {elapsed_seconds:8.3f}s  {result['throughput']:10.1f} {unit:<11} peak {peak_mb:8.1f}MB  rss {max_rss_mb:8.1f}MB")
+
+    def _create_http_client(self) -> HttpClient:
+        # 代替サーバーには実サービス用のレート制限を掛けない (応答時間は--latency-msで模擬)
+        http_client = HttpClient(backoff_seconds=0.0)
+        http_client.set_rate_limit("127.0.0.1", 1e9, 1e9)
+        return http_client
+
+    def _prepare_filings(self, directory: str, file_format: str) -> list[str]:
+
+        # ダウンロード結果と同じファイル名で書類を置く (解析のみの計測用)
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index in range(self._fixture_set.get_company_count()):
+            company = self._fixture_set.get_company(index)
+            path = os.path.join(directory, f"{company['edinet_code']}_{company['date']}_{company['doc_id']}.{file_format}")
+            with open(path, "wb") as f:
+                f.write(self._fixture_set.get_xbrl(index) if file_format == "xbrl" else self._fixture_set.get_csv(index))
+            paths.append(path)
+        return paths
+
+    def run_download(self):
+
+        dates = self._fixture_set.get_dates()
+        start, end = datetime.strptime(dates[0], "%Y-%m-%d"), datetime.strptime(dates[-1], "%Y-%m-%d")
+        for file_format, use_pack in [("xbrl", False), ("csv", False), ("xbrl", True)]:
+            download_path = os.path.join(self._work_dir, f"download_{file_format}{'_pack' if use_pack else ''}")
+            os.makedirs(download_path, exist_ok=True)
+            wrapper = EdinetApiWrapper(
+                "benchmark",
+                download_path,
+                http_client=self._create_http_client(),
+                file_format=file_format,
+                use_pack=use_pack,
+                disclosure_base_url=self._base_url + "/api/v2",
+                api_base_url=self._base_url + "/api/v2",
+            )
+            name = f"download ({file_format}{', pack' if use_pack else ''})"
+            self._measure(name, "docs/s", lambda: wrapper.download_xbrl_files(start, end))
+
+    def run_parse(self):
+
+        xbrl_paths = self._prepare_filings(os.path.join(self._work_dir, "parse_xbrl"), "xbrl")
+        csv_paths = self._prepare_filings(os.path.join(self._work_dir, "parse_csv"), "csv")
+
+        def parse_all(paths: list[str], engine: str) -> int:
+            for path in paths:
+                XBRLParserWrapper(path, engine=engine).get_record()
+            return len(paths)
+
+        self._measure("parse (dom)", "files/s", lambda: parse_all(xbrl_paths, "dom"))
+        self._measure("parse (stream)", "files/s", lambda: parse_all(xbrl_paths, "stream"))
+        self._measure("parse (csv)", "files/s", lambda: parse_all(csv_paths, "csv"))
+
+        # ワーカープロセスのメモリはtracemallocに含まれない
+        parser = XBRLParallelParser(max_workers=self._max_workers)
+        self._measure("parse (parallel, stream)", "files/s", lambda: len(parser.parse_files(xbrl_paths)))
+
+    def run_scrapers(self):
+
+        companies = [self._fixture_set.get_company(index) for index in range(self._fixture_set.get_company_count())]
+
+        http_client = self._create_http_client()
+        yahoo_finance_jp = YahooFinanceJPWrapper(http_client, base_url=self._base_url)
+        http_client.set_rate_limit("127.0.0.1", 1e9, 1e9)
+
+        def search_all() -> int:
+            return sum(yahoo_finance_jp.get_company_info(company["company_name"])[0] >= 0 for company in companies)
+
+        self._measure("scrape (yahoo search)", "pages/s", search_all)
+
+        MinkabuWrapper.set_base_url(self._base_url)
+
+        async def fetch_all() -> list[MinkabuWrapper]:
+            return await asyncio.gather(*[MinkabuWrapper.create_async(company["company_code"], http_client) for company in companies])
+
+        self._measure("scrape (minkabu)", "pages/s", lambda: len(asyncio.run(fetch_all())))
+        http_client.close()
+
+    def run_analyze(self):
+
+        # analyze() は保存先のファイルを全て解析して絞り込む
+        app.download_path = os.path.join(self._work_dir, "analyze")
+        self._prepare_filings(app.download_path, "xbrl")
+        MinkabuWrapper.set_base_url(self._base_url)
+
+        http_client = HttpClient.get_shared()
+        yahoo_finance_jp = YahooFinanceJPWrapper(http_client, base_url=self._base_url)
+        http_client.set_rate_limit("127.0.0.1", 1e9, 1e9)
+        yahoo_finance = FixtureYahooFinanceWrapper(PriceHistoryStore(app.download_path), self._fixture_set, self._latency_seconds)
+
+        def analyze() -> int:
+            app.analyze(max_workers=self._max_workers, yahoo_finance=yahoo_finance, yahoo_finance_jp=yahoo_finance_jp)
+            return self._fixture_set.get_company_count()
+
+        # 2回目は解析結果・ページ・株価のキャッシュが効いた状態
+        self._measure("analyze (cold)", "companies/s", analyze)
+        self._measure("analyze (warm)", "companies/s", analyze)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline benchmarks against recorded fixtures")
+    parser.add_argument("--companies", type=int, default=200)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--padding-kb", type=int, default=0, help="extra text per filing to approximate real document sizes")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--benchmarks", default="download,parse,scrapers,analyze")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="skip peak memory tracing (it slows down allocation-heavy code)")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--keep-dir", action="store_true")
+    args = parser.parse_args()
+
+    fixture_set = FixtureSet(args.companies, args.days, padding_bytes=args.padding_kb * 1024)
+    latency_seconds = args.latency_ms / 1000.0
+    server = StandInServer(fixture_set, latency_seconds)
+    base_url = server.start()
+    work_dir = tempfile.mkdtemp(prefix="vsi_bench_")
+
+    trace_memory = not args.no_tracemalloc
+    if trace_memory:
+        tracemalloc.start()
+
+    runner = BenchmarkRunner(fixture_set, base_url, work_dir, latency_seconds, args.max_workers, trace_memory)
+    benchmarks = {
+        "download": runner.run_download,
+        "parse": runner.run_parse,
+        "scrapers": runner.run_scrapers,
+        "analyze": runner.run_analyze,
+    }
+    try:
+        print(f"companies={args.companies} days={args.days} latency={args.latency_ms}ms server={base_url} work_dir={work_dir}")
+        for name in args.benchmarks.split(","):
+            benchmarks[name]()
+
+        with urllib.request.urlopen(base_url + "/stats") as response:
+            server_stats = json.loads(response.read())
+        print(f"server: {server_stats['requests']} ({server_stats['bytes_sent'] / 1024 / 1024:.1f}MB sent)")
+    finally:
+        server.stop()
+        if not args.keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            summary = {"config": vars(args), "results": runner.get_results(), "server": server_stats, "metrics": Metrics.get_shared().get_summary()}
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .fixtureset import FixtureSet
+
+
+class StandInServer:
+
+    # EDINET API / Yahoo!ファイナンス / みんかぶ の代わりに記録した応答を返す
+    # /api/v2/documents.json, /api/v2/documents/{docID}, /search/?query=, /stock/{code}, /stats
+
+    def __init__(self, fixture_set: FixtureSet, latency_seconds: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self._fixture_set = fixture_set
+        self._latency_seconds = latency_seconds
+        self._host = host
+        self._port = port
+        self._request_counts: dict[str, int] = {}
+        self._bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self._process: multiprocessing.Process | None = None
+
+    def get_base_url(self) -> str:
+        return f"http://{self._host}:{self._port}"
+
+    def _route(self, path: str, params: dict[str, str]) -> tuple[str, int, str, bytes]:
+
+        # (種類, ステータス, Content-Type, 本文)
+        if path == "/api/v2/documents.json":
+            return ("documents.json", 200, "application/json; charset=utf-8", self._fixture_set.get_documents_json(params.get("date", "")))
+        if path.startswith("/api/v2/documents/"):
+            body = self._fixture_set.get_zip(path.rsplit("/", 1)[-1], int(params.get("type", "1")))
+            if body is None:
+                return ("documents", 404, "application/json; charset=utf-8", b'{"metadata": {"status": "404", "message": "Not Found"}}')
+            return ("documents", 200, "application/octet-stream", body)
+        if path == "/search/":
+            return ("yahoo", 200, "text/html; charset=utf-8", self._fixture_set.get_yahoo_search(params.get("query", "")))
+        if path.startswith("/stock/"):
+            body = self._fixture_set.get_minkabu(path.rstrip("/").rsplit("/", 1)[-1])
+            if body is None:
+                return ("minkabu", 404, "text/html; charset=utf-8", b"<html><body>Not Found</body></html>")
+            return ("minkabu", 200, "text/html; charset=utf-8", body)
+        if path == "/stats":
+            with self._lock:
+                stats = {"requests": dict(self._request_counts), "bytes_sent": self._bytes_sent}
+            return ("stats", 200, "application/json", json.dumps(stats).encode("utf-8"))
+        return ("unknown", 404, "text/plain", b"not found")
+
+    def _create_handler(self):
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed_url = urllib.parse.urlparse(self.path)
+                params = {key: values[-1] for key, values in urllib.parse.parse_qs(parsed_url.query).items()}
+                kind, status, content_type, body = server._route(parsed_url.path, params)
+
+                # 実サービスの応答時間の代わり
+                if kind != "stats" and server._latency_seconds > 0:
+                    time.sleep(server._latency_seconds)
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+                with server._lock:
+                    server._request_counts[kind] = server._request_counts.get(kind, 0) + 1
+                    server._bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self, ready=None):
+        self._server = ThreadingHTTPServer((self._host, self._port), self._create_handler())
+        self._server.daemon_threads = True
+        self._port = self._server.server_address[1]
+        if ready is not None:
+            ready.put(self._port)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self) -> str:
+
+        # 計測対象と同じプロセスだとGILとメモリ計測に影響するので別プロセスで動かす
+        ready = multiprocessing.Queue()
+        args = (self._fixture_set, self._latency_seconds, self._host, self._port, ready)
+        self._process = multiprocessing.Process(target=_serve, args=args, daemon=True)
+        self._process.start()
+        self._port = ready.get(timeout=30)
+        return self.get_base_url()
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+
+def _serve(fixture_set: FixtureSet, latency_seconds: float, host: str, port: int, ready):
+    StandInServer(fixture_set, latency_seconds, host, port).serve_forever(ready)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay recorded EDINET / Yahoo / Minkabu responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    server = StandInServer(FixtureSet(args.companies, args.days), args.latency_ms / 1000.0, args.host, args.port)
+    print(f"serving on {server.get_base_url()}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
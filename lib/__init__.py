@@ -1,4 +1,22 @@
 from .edinetapiwrapper import EdinetApiWrapper
+from .edinetmanifest import EdinetManifest
+from .edinetdocumentindex import EdinetDocumentIndex
 from .xbrlparserwrapper import XBRLParserWrapper
+from .xbrlcsvparser import XBRLCsvParser
+from .xbrlparallelparser import XBRLParallelParser
+from .xbrlresultcache import XBRLResultCache
 from .yahoofinancewrapper import YahooFinanceJPWrapper, YahooFinanceWrapper
-from .minkabuwrapper import MinkabuWrapper
+from .minkabuwrapper import MinkabuWrapper, MinkabuStockInfo, MinkabuParseError
+from .fundamentalsrecord import FundamentalsRecord
+from .fundamentalsscreener import FundamentalsScreener
+from .metrics import Metrics
+from .httpclient import HttpClient, TokenBucket
+from .httpcache import HttpResponseCache
+from .pricehistorystore import PriceHistoryStore
+from .filingpack import FilingPack
+from .screeningpipeline import ScreeningPipeline, ScreeningSource, ScreeningStage
+from .valuescreen import ValueScreen
+from .screeningservice import ScreeningService
+from .screenresult import ScreenResult, ScreenResultWriter, TopKRanking
+from .sharding import ShardSpec, ShardResults
+from .valuebacktest import ValueBacktest
@@ -1,10 +1,19 @@
 import os
 import requests
-import io
 import zipfile
-import pandas as pd
-import urllib
+import hashlib
+import tempfile
+import threading
+import time
+from typing import IO
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from .edinetmanifest import EdinetManifest
+from .httpclient import HttpClient
+from .edinetdocumentindex import EdinetDocumentIndex
+from .filingpack import FilingPack
+from .metrics import Metrics
+from .sharding import ShardSpec
 
 
 class EdinetApiWrapper:
@@ -18,104 +27,235 @@ class EdinetApiWrapper:
             current_date += timedelta(days=1)
         return date_list
 
-    def _save_xbrl_file_from_zip_bytes(self, zip_bytes: bytes, xbrl_path: str) -> bool:
-
-        # extract zip in memory
-        with io.BytesIO(zip_bytes) as zb:
-            # find .xbrl file
-            with zipfile.ZipFile(zb, "r") as zf:
-                target_file_name = ""
-                for file_name in zf.namelist():
-                    # filter out xbrl in PublicDoc dir
-                    if "PublicDoc" in file_name and ".xbrl" in file_name:
-                        target_file_name = file_name
-                        break
-
-                # check if target wasn't be found
-                if len(target_file_name) == 0:
-                    print("couldn't find xbrl file")
-                    return False
-
-                # write out xbrl file
-                with zf.open(target_file_name) as extracted_file:
-                    content = extracted_file.read()
-                with open(xbrl_path, "wb") as xbrl_out:
-                    xbrl_out.write(content)
-                print("saved: " + target_file_name)
-                return True
-
-    def _get_doc_info(self, date_str: str) -> list[tuple[str, str, str, str]]:
+    def _request(self, url: str, params: dict) -> requests.Response:
+
+        # 同時リクエスト数を制限
+        with self._in_flight:
+            response = self._http_client.get(url, params)
+        response.raise_for_status()
+        return response
+
+    def _download_to_file(self, url: str, params: dict, path: str):
+
+        # 同時リクエスト数を制限 (本文の受信が終わるまで)
+        with self._in_flight:
+            with self._http_client.get(url, params, stream=True) as response:
+                response.raise_for_status()
+                size = 0
+                with open(path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self._chunk_size):
+                        f.write(chunk)
+                        size += len(chunk)
+                Metrics.get_shared().increment("edinet.bytes_downloaded", size)
+
+    def _find_target_file_name(self, zf: zipfile.ZipFile) -> str:
+
+        for file_name in zf.namelist():
+            if self._file_format == "csv":
+                # 本文 (jpcrp) のCSVのみ、監査報告書 (jpaud) は不要
+                if "XBRL_TO_CSV/jpcrp" in file_name and file_name.endswith(".csv"):
+                    return file_name
+            # filter out xbrl in PublicDoc dir
+            elif "PublicDoc" in file_name and ".xbrl" in file_name:
+                return file_name
+        return ""
+
+    def _copy_to_file(self, stream: IO[bytes], path: str) -> str:
+
+        # 一時ファイル経由で途中終了時に壊れたファイルを残さない
+        digest = hashlib.sha256()
+        temp_path = path + ".part"
+        with open(temp_path, "wb") as out:
+            for chunk in iter(lambda: stream.read(self._chunk_size), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(temp_path, path)
+        return digest.hexdigest()
+
+    def _save_target_file_from_zip(self, zip_path: str, xbrl_path: str) -> str | None:
+
+        # find target file
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            target_file_name = self._find_target_file_name(zf)
+
+            # check if target wasn't be found
+            if len(target_file_name) == 0:
+                print(f"couldn't find {self._file_format} file")
+                return None
+
+            # 展開しながら書き出す (全体をメモリに載せない)
+            with zf.open(target_file_name) as extracted_file:
+                if FilingPack.is_pack_source(xbrl_path):
+                    sha256 = self._filing_pack.append(xbrl_path, extracted_file, self._chunk_size)
+                else:
+                    sha256 = self._copy_to_file(extracted_file, xbrl_path)
+            print("saved: " + target_file_name)
+            return sha256
+
+    def _sync_document_list(self, date_str: str) -> int:
+
+        # 取得済みの過去日はローカルの索引を使う
+        if self._document_index.has_date(date_str):
+            Metrics.get_shared().increment("edinet.document_list_index_hits")
+            return 0
 
         # get document list on the date
         params = {"date": date_str, "type": 2, "Subscription-Key": self._edinet_api_key}  # 決算書類
-        url = "https://disclosure.edinet-fsa.go.jp/api/v2/documents.json"
-        response = requests.get(url=url, params=params)
-        data = response.json()
+        url = f"{self._disclosure_base_url}/documents.json"
+        with Metrics.get_shared().timer("edinet.sync_document_list"):
+            response = self._request(url, params)
+            data = response.json()
 
-        # json to DataFrame
         documents = data["results"]
-        if len(documents) == 0:
-            return []
-        df = pd.DataFrame(documents)
-        df_filtered = df[["docID", "secCode", "edinetCode", "filerName", "docDescription", "submitDateTime"]]
+        is_final = date_str < datetime.now().strftime("%Y-%m-%d")
+        self._document_index.store(date_str, documents, is_final)
+        return len(documents)
 
-        # まとめ
-        result = []
-        for index, doc in df_filtered.iterrows():
+    def _get_doc_info(self, start_date_str: str, end_date_str: str) -> list[tuple[str, str, str | None, str, str]]:
 
-            if doc["docDescription"] is None or not "有価証券報告書" in doc["docDescription"]:
-                continue
+        df = self._document_index.query(start_date_str, end_date_str, description_keyword="有価証券報告書")
+        df_filtered = df[["filerName", "edinetCode", "secCode", "submitDateTime", "docID"]]
+        df_filtered = df_filtered.astype(object).where(df_filtered.notna(), None)
 
-            # print(doc["filerName"] + ": " + doc["submitDateTime"] + ": " + doc["docDescription"] + ": " + doc["docID"])
-            result.append((doc["filerName"], doc["edinetCode"], doc["submitDateTime"], doc["docID"]))
+        # まとめ
+        return list(df_filtered.itertuples(index=False, name=None))
 
-        return result
+    def _download_zip_and_extract_xbrl(self, doc_id: str, xbrl_path: str) -> str | None:
 
-    def _download_zip_and_extract_xbrl(self, doc_id: str, xbrl_path: str) -> bool:
+        # type=1: 提出本文書及び監査報告書 (zip), type=5: CSV (zip)
+        url = f"{self._api_base_url}/documents/{doc_id}"
+        params = {"type": 5 if self._file_format == "csv" else 1, "Subscription-Key": self._edinet_api_key}
 
-        url = f"https://api.edinet-fsa.go.jp/api/v2/documents/{doc_id}?type=1&Subscription-Key={self._edinet_api_key}"
-        max_loop = 3
-        for loop in range(max_loop):
+        # zipは一時ファイルに受信してから必要なファイルだけ取り出す
+        file_descriptor, zip_path = tempfile.mkstemp(suffix=".zip", dir=self._download_path)
+        os.close(file_descriptor)
+        try:
+            # 再試行とバックオフはHttpClient側で行う
             try:
-                with urllib.request.urlopen(url) as res:
-                    zip_bytes = res.read()
-                break
-            except urllib.error.HTTPError as e:
-                print("failed to download: " + doc_id + ", " + e.reason)
-            except SystemError as e:
-                print("something wrong")
-            if loop == max_loop - 1:
-                print("exceeded retry loop!")
-        if zip_bytes is not None:
+                self._download_to_file(url, params, zip_path)
+            except requests.exceptions.HTTPError as e:
+                print("failed to download: " + doc_id + ", " + str(e.response.reason))
+                return None
+            except requests.exceptions.RequestException as e:
+                print("something wrong: " + doc_id + ", " + str(e))
+                return None
+
             print("downloaded: " + doc_id)
-            return self._save_xbrl_file_from_zip_bytes(zip_bytes, xbrl_path)
-        return False
+            try:
+                return self._save_target_file_from_zip(zip_path, xbrl_path)
+            except zipfile.BadZipFile:
+                print("not a zip file: " + doc_id)
+                return None
+        finally:
+            os.remove(zip_path)
+
+    def _download_document(self, doc_id: str, xbrl_path: str) -> bool:
+
+        metrics = Metrics.get_shared()
+        with metrics.timer("edinet.download_document"):
+            sha256 = self._download_zip_and_extract_xbrl(doc_id, xbrl_path)
+        if sha256 is None:
+            metrics.increment("edinet.documents_failed")
+            return False
+
+        metrics.increment("edinet.documents_downloaded")
+        self._manifest.mark_complete(doc_id, sha256)
+        return True
+
+    def _get_xbrl_path(self, edinet_code: str, submit_date_time: str, doc_id: str) -> str:
+
+        submit_day = submit_date_time.split(" ")[0]
+        filename = f"{edinet_code}_{submit_day}_{doc_id}.{self._file_format}"
+        if self._use_pack:
+            # 提出月毎のアーカイブに格納
+            return self._filing_pack.make_source(submit_day[:7], filename)
+        return os.path.join(self._download_path, filename)
+
+    def __init__(
+        self,
+        edinet_api_key: str,
+        download_path: str,
+        max_workers: int = 8,
+        max_in_flight: int = 4,
+        http_client: HttpClient | None = None,
+        file_format: str = "xbrl",
+        use_pack: bool = False,
+        disclosure_base_url: str = "https://disclosure.edinet-fsa.go.jp/api/v2",
+        api_base_url: str = "https://api.edinet-fsa.go.jp/api/v2",
+        shard: ShardSpec | None = None,
+    ):
+        if not file_format in ("xbrl", "csv"):
+            raise ValueError("unknown file format: " + file_format)
 
-    def __init__(self, edinet_api_key: str, download_path: str):
         self._edinet_api_key = edinet_api_key
+        self._disclosure_base_url = disclosure_base_url.rstrip("/")
+        self._api_base_url = api_base_url.rstrip("/")
+        self._shard = shard
+        self._file_format = file_format
+        self._use_pack = use_pack
+        self._filing_pack = FilingPack(os.path.join(download_path, "packs"))
+        self._chunk_size = 1024 * 1024
         self._download_path = download_path
+        self._max_workers = max_workers
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._http_client = http_client if http_client is not None else HttpClient.get_shared()
+        self._manifest = EdinetManifest(download_path)
+        self._document_index = EdinetDocumentIndex(download_path)
+
+    def get_document_index(self) -> EdinetDocumentIndex:
+        return self._document_index
+
+    def download_xbrl_files(self, start: datetime, end: datetime) -> int:
+
+        # 一覧を取得済みの日付は除く (それより前の期間を後から指定しても取得する)
+        requested_dates = self._generate_date_range_str(start, end)
+        synced_dates = self._manifest.get_synced_dates(requested_dates)
+        date_list = [date_str for date_str in requested_dates if not date_str in synced_dates]
+        if len(synced_dates) > 0:
+            print(f"skipping {len(synced_dates)}/{len(requested_dates)} dates already synced")
+
+        # 当日分は提出が続くので同期済みにしない
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        closed_dates = [date_str for date_str in date_list if date_str < today_str]
+
+        # 完了済みでもファイルが消えていれば取り直し
+        for doc_id, xbrl_path, sha256 in self._manifest.get_complete():
+            if not FilingPack.exists(xbrl_path):
+                print("file missing: " + xbrl_path)
+                Metrics.get_shared().increment("edinet.files_missing")
+                self._manifest.mark_pending(doc_id)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
 
-    def download_xbrl_files(self, start: datetime, end: datetime):
-        date_list = self._generate_date_range_str(start, end)
+            # 書類一覧を索引に同期
+            list(executor.map(self._sync_document_list, date_list))
 
-        companies = {}
+            # 索引は日付・提出順で返すので重複排除の結果は決定的
+            companies = {}
 
-        # 重複は最新で上書き
-        for date_str in date_list:
-            doc_info = self._get_doc_info(date_str)
-            for filer_name, edinet_code, submit_date_time, doc_id in doc_info:
-                companies[filer_name] = (edinet_code, submit_date_time, doc_id)
+            # 重複は最新で上書き
+            if len(date_list) > 0:
+                doc_info = self._get_doc_info(date_list[0], date_list[-1])
+                for filer_name, edinet_code, sec_code, submit_date_time, doc_id in doc_info:
+                    companies[filer_name] = (edinet_code, sec_code, submit_date_time, doc_id)
 
-        # ダウンロード
-        for edinet_code, submit_date_time, doc_id in companies.values():
+            # 分割実行時は担当する会社のみ (同じ会社の書類は常に同じシャード)
+            if self._shard is not None:
+                companies = {filer_name: company for filer_name, company in companies.items() if self._shard.owns(company[0] or "")}
 
-            submit_day = submit_date_time.split(" ")[0]
-            filename = f"{edinet_code}_{submit_day}_{doc_id}.xbrl"
-            xbrl_path = os.path.join(self._download_path, filename)
+            # 先にpendingとして記録しておき、途中で落ちても次回はそこから再開する
+            for filer_name, (edinet_code, sec_code, submit_date_time, doc_id) in companies.items():
+                xbrl_path = self._get_xbrl_path(edinet_code, submit_date_time, doc_id)
+                self._manifest.add_pending(doc_id, edinet_code, sec_code, filer_name, submit_date_time, xbrl_path)
+            self._manifest.add_synced_dates(closed_dates)
 
-            if os.path.exists(xbrl_path):
-                print("file exists: " + xbrl_path)
-                # continue
-                os.remove(xbrl_path)
+            # ダウンロード
+            start_time = time.perf_counter()
+            targets = self._manifest.get_pending()
+            results = list(executor.map(lambda target: self._download_document(*target), targets))
+            elapsed_seconds = time.perf_counter() - start_time
 
-            self._download_zip_and_extract_xbrl(doc_id, xbrl_path)
+        downloaded = sum(results)
+        throughput = downloaded / elapsed_seconds if elapsed_seconds > 0 else 0.0
+        print(f"downloaded {downloaded}/{len(targets)} documents in {elapsed_seconds:.1f}s ({throughput:.2f} docs/s)")
+        return downloaded
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+
+class EdinetDocumentIndex:
+
+    # documents.json (type=2) の全項目
+    _columns = [
+        "seqNumber",
+        "docID",
+        "edinetCode",
+        "secCode",
+        "JCN",
+        "filerName",
+        "fundCode",
+        "ordinanceCode",
+        "formCode",
+        "docTypeCode",
+        "periodStart",
+        "periodEnd",
+        "submitDateTime",
+        "docDescription",
+        "issuerEdinetCode",
+        "subjectEdinetCode",
+        "subsidiaryEdinetCode",
+        "currentReportReason",
+        "parentDocID",
+        "opeDateTime",
+        "withdrawalStatus",
+        "docInfoEditStatus",
+        "disclosureStatus",
+        "xbrlFlag",
+        "pdfFlag",
+        "attachDocFlag",
+        "englishDocFlag",
+        "csvFlag",
+        "legalStatus",
+    ]
+
+    def _create_tables(self):
+
+        columns = ", ".join(f'"{column}"' for column in self._columns)
+        with self._lock, self._connection:
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS documents (listingDate TEXT NOT NULL, {columns}, PRIMARY KEY (listingDate, "docID"))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS documents_doc_type ON documents ("docTypeCode", listingDate)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS documents_sec_code ON documents ("secCode")')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS documents_edinet_code ON documents ("edinetCode")')
+            self._connection.execute("CREATE TABLE IF NOT EXISTS listed_dates (listingDate TEXT PRIMARY KEY)")
+
+    def __init__(self, download_path: str, filename: str = "documents_index.sqlite3"):
+        self._path = os.path.join(download_path, filename)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._create_tables()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def has_date(self, date_str: str) -> bool:
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM listed_dates WHERE listingDate = ?", (date_str,)).fetchone()
+        return row is not None
+
+    def store(self, date_str: str, documents: list[dict], is_final: bool):
+
+        # 過去日の一覧は変わらないので確定扱い、当日分は毎回入れ替える
+        columns = ", ".join(f'"{column}"' for column in self._columns)
+        placeholders = ", ".join("?" for _ in range(len(self._columns) + 1))
+        rows = [tuple([date_str] + [document.get(column) for column in self._columns]) for document in documents]
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM documents WHERE listingDate = ?", (date_str,))
+            self._connection.executemany(f"INSERT INTO documents (listingDate, {columns}) VALUES ({placeholders})", rows)
+            if is_final:
+                self._connection.execute("INSERT OR IGNORE INTO listed_dates (listingDate) VALUES (?)", (date_str,))
+
+    def query(
+        self,
+        start_date_str: str,
+        end_date_str: str,
+        doc_type_codes: list[str] | None = None,
+        description_keyword: str | None = None,
+        sec_code_only: bool = False,
+    ) -> pd.DataFrame:
+
+        conditions = ["listingDate BETWEEN ? AND ?"]
+        params: list = [start_date_str, end_date_str]
+        if doc_type_codes is not None:
+            conditions.append('"docTypeCode" IN (' + ", ".join("?" for _ in doc_type_codes) + ")")
+            params.extend(doc_type_codes)
+        if description_keyword is not None:
+            conditions.append('"docDescription" LIKE ?')
+            params.append(f"%{description_keyword}%")
+        if sec_code_only:
+            conditions.append('"secCode" IS NOT NULL')
+
+        sql = "SELECT * FROM documents WHERE " + " AND ".join(conditions) + ' ORDER BY listingDate, "seqNumber"'
+        with self._lock:
+            return pd.read_sql_query(sql, self._connection, params=params)
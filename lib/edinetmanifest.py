@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import threading
+
+
+class EdinetManifest:
+
+    def _create_tables(self):
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    edinet_code TEXT NOT NULL,
+                    sec_code TEXT,
+                    filer_name TEXT NOT NULL,
+                    submit_date_time TEXT NOT NULL,
+                    xbrl_path TEXT NOT NULL,
+                    sha256 TEXT,
+                    status TEXT NOT NULL
+                )
+                """
+            )
+            # 証券コード列が無い古いmanifestに追加
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(documents)")]
+            if not "sec_code" in columns:
+                self._connection.execute("ALTER TABLE documents ADD COLUMN sec_code TEXT")
+            # 書類一覧を取得し終えた(提出が締め切られた)日付
+            self._connection.execute("CREATE TABLE IF NOT EXISTS synced_dates (date TEXT PRIMARY KEY)")
+
+    def __init__(self, download_path: str, filename: str = "manifest.sqlite3"):
+        self._path = os.path.join(download_path, filename)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._create_tables()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_synced_dates(self, date_strs: list[str]) -> set[str]:
+        if len(date_strs) == 0:
+            return set()
+        with self._lock:
+            rows = self._connection.execute("SELECT date FROM synced_dates WHERE date BETWEEN ? AND ?", (min(date_strs), max(date_strs))).fetchall()
+        return set(row[0] for row in rows) & set(date_strs)
+
+    def add_synced_dates(self, date_strs: list[str]):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO synced_dates (date) VALUES (?)", [(date_str,) for date_str in date_strs])
+
+    def add_pending(self, doc_id: str, edinet_code: str, sec_code: str | None, filer_name: str, submit_date_time: str, xbrl_path: str):
+        # 完了済みのものはそのまま
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO documents (doc_id, edinet_code, sec_code, filer_name, submit_date_time, xbrl_path, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending')",
+                (doc_id, edinet_code, sec_code, filer_name, submit_date_time, xbrl_path),
+            )
+            self._connection.execute("UPDATE documents SET sec_code = ? WHERE doc_id = ? AND sec_code IS NULL", (sec_code, doc_id))
+
+    def mark_complete(self, doc_id: str, sha256: str):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE documents SET status = 'complete', sha256 = ? WHERE doc_id = ?", (sha256, doc_id))
+
+    def mark_pending(self, doc_id: str):
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE documents SET status = 'pending', sha256 = NULL WHERE doc_id = ?", (doc_id,))
+
+    def get_pending(self) -> list[tuple[str, str]]:
+        # (doc_id, xbrl_path), 提出日時順
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT doc_id, xbrl_path FROM documents WHERE status = 'pending' ORDER BY submit_date_time, doc_id"
+            ).fetchall()
+        return rows
+
+    def get_complete(self) -> list[tuple[str, str, str]]:
+        # (doc_id, xbrl_path, sha256)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT doc_id, xbrl_path, sha256 FROM documents WHERE status = 'complete' ORDER BY submit_date_time, doc_id"
+            ).fetchall()
+        return rows
+
+    def get_security_codes(self) -> dict[str, str]:
+        # doc_id -> 証券コード(5桁)
+        with self._lock:
+            rows = self._connection.execute("SELECT doc_id, sec_code FROM documents WHERE sec_code IS NOT NULL").fetchall()
+        return dict(rows)
@@ -0,0 +1,210 @@
+import io
+import os
+import json
+import mmap
+import zlib
+import hashlib
+import threading
+from typing import IO
+
+# 別プロセスからの追記と排他する (無い環境ではプロセス内のみ)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class PackMemberReader(io.RawIOBase):
+
+    def __init__(self, pack_path: str, offset: int, length: int):
+        self._file = open(pack_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._position = offset
+        self._end = offset + length
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b""
+        self._chunk_size = 256 * 1024
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+
+        # 圧縮データを少しずつ展開して返す (全体は展開しない)
+        while len(self._buffer) == 0:
+            if self._position >= self._end:
+                self._buffer = self._decompressor.flush()
+                if len(self._buffer) == 0:
+                    return 0
+                break
+            chunk_end = min(self._position + self._chunk_size, self._end)
+            self._buffer = self._decompressor.decompress(self._mmap[self._position : chunk_end])
+            self._position = chunk_end
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._mmap.close()
+            self._file.close()
+        super().close()
+
+
+class FilingPack:
+
+    # 月毎の追記専用アーカイブ: {yyyy-mm}.pack (zlib圧縮した書類を連結) + {yyyy-mm}.idx (オフセット索引, JSON Lines)
+    _pack_suffix = ".pack"
+    _index_suffix = ".idx"
+    _separator = "#"
+
+    _index_cache: dict[str, tuple[tuple[int, int], dict[str, dict]]] = {}
+    _index_cache_lock = threading.Lock()
+
+    def __init__(self, pack_dir: str):
+        self._pack_dir = pack_dir
+        self._lock = threading.Lock()
+
+    def make_source(self, month: str, name: str) -> str:
+        # month: YYYY-MM, name: 書類のファイル名
+        return os.path.join(self._pack_dir, month + self._pack_suffix) + self._separator + name
+
+    def append(self, source: str, stream: IO[bytes], chunk_size: int = 1024 * 1024) -> str:
+
+        pack_path, name = self._split_source(source)
+        index_path = pack_path[: -len(self._pack_suffix)] + self._index_suffix
+        digest = hashlib.sha256()
+        size = 0
+
+        with self._lock:
+            os.makedirs(self._pack_dir, exist_ok=True)
+            with open(pack_path, "ab") as pack_file:
+                # 索引への追記まで他のプロセス (同じ月を扱うシャード等) を待たせる
+                if fcntl is not None:
+                    fcntl.flock(pack_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    offset = pack_file.seek(0, os.SEEK_END)
+                    compressor = zlib.compressobj(6)
+                    for chunk in iter(lambda: stream.read(chunk_size), b""):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        pack_file.write(compressor.compress(chunk))
+                    pack_file.write(compressor.flush())
+                    pack_file.flush()
+                    os.fsync(pack_file.fileno())
+                    length = pack_file.tell() - offset
+
+                    # データを書き終えてから索引に追記 (途中で落ちても索引は壊れない)
+                    entry = {"name": name, "offset": offset, "length": length, "size": size, "sha256": digest.hexdigest()}
+                    with open(index_path, "a", encoding="utf-8") as index_file:
+                        index_file.write(json.dumps(entry) + "\n")
+                        index_file.flush()
+                        os.fsync(index_file.fileno())
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(pack_file.fileno(), fcntl.LOCK_UN)
+
+        return digest.hexdigest()
+
+    def list_sources(self) -> list[str]:
+
+        sources = []
+        if not os.path.exists(self._pack_dir):
+            return sources
+        for filename in sorted(os.listdir(self._pack_dir)):
+            if not filename.endswith(self._pack_suffix):
+                continue
+            pack_path = os.path.join(self._pack_dir, filename)
+            for name in sorted(self._load_index(pack_path).keys()):
+                sources.append(pack_path + self._separator + name)
+        return sources
+
+    @classmethod
+    def get_doc_id(cls, source: str) -> str:
+        # {edinet_code}_{提出日}_{docID}.{xbrl|csv} -> docID
+        name = cls._split_source(source)[1] if cls.is_pack_source(source) else os.path.basename(source)
+        return os.path.splitext(name)[0].rsplit("_", 1)[-1]
+
+    @classmethod
+    def unique_by_doc_id(cls, sources: list[str]) -> list[str]:
+        # 同じ書類が通常ファイルとアーカイブの両方にある場合は先に出てきた方のみ
+        doc_ids = set()
+        unique_sources = []
+        for source in sources:
+            doc_id = cls.get_doc_id(source)
+            if doc_id in doc_ids:
+                continue
+            doc_ids.add(doc_id)
+            unique_sources.append(source)
+        return unique_sources
+
+    @classmethod
+    def is_pack_source(cls, source: str) -> bool:
+        return cls._separator in source and source.split(cls._separator, 1)[0].endswith(cls._pack_suffix)
+
+    @classmethod
+    def _split_source(cls, source: str) -> tuple[str, str]:
+        pack_path, name = source.split(cls._separator, 1)
+        return pack_path, name
+
+    @classmethod
+    def _load_index(cls, pack_path: str) -> dict[str, dict]:
+
+        index_path = pack_path[: -len(cls._pack_suffix)] + cls._index_suffix
+        if not os.path.exists(index_path):
+            return {}
+
+        # 索引が更新されていなければ読み直さない
+        stat = os.stat(index_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with cls._index_cache_lock:
+            cached = cls._index_cache.get(index_path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+        # 同じ書類が再度追加された場合は新しい方を使う
+        entries = {}
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                entries[entry["name"]] = entry
+
+        with cls._index_cache_lock:
+            cls._index_cache[index_path] = (signature, entries)
+        return entries
+
+    @classmethod
+    def _get_entry(cls, source: str) -> dict | None:
+        pack_path, name = cls._split_source(source)
+        return cls._load_index(pack_path).get(name)
+
+    @classmethod
+    def exists(cls, source: str) -> bool:
+        if not cls.is_pack_source(source):
+            return os.path.exists(source)
+        return cls._get_entry(source) is not None
+
+    @classmethod
+    def stat(cls, source: str) -> tuple[int, int]:
+        # 通常ファイル: (更新時刻, サイズ), アーカイブ内: (オフセット, 長さ) ※追記専用なので位置が変わらなければ内容も同じ
+        if not cls.is_pack_source(source):
+            stat = os.stat(source)
+            return (stat.st_mtime_ns, stat.st_size)
+        entry = cls._get_entry(source)
+        if entry is None:
+            raise FileNotFoundError(source)
+        return (entry["offset"], entry["length"])
+
+    @classmethod
+    def open(cls, source: str) -> IO[bytes]:
+        if not cls.is_pack_source(source):
+            return open(source, "rb")
+        entry = cls._get_entry(source)
+        if entry is None:
+            raise FileNotFoundError(source)
+        pack_path, name = cls._split_source(source)
+        return io.BufferedReader(PackMemberReader(pack_path, entry["offset"], entry["length"]))
@@ -0,0 +1,163 @@
+import math
+from datetime import datetime
+
+
+class FundamentalsRecord:
+
+    # 欠損値: 文字列は "", 数値は NaN
+    MISSING_STR = ""
+    MISSING_FLOAT = math.nan
+
+    # 属性名 -> xbrl解析結果の項目名
+    _str_fields = {
+        "edinet_code": "EdinetCode",
+        "security_code": "証券コード",
+        "filing_date": "FilingDate",
+        "company_name": "会社名",
+        "company_name_en": "会社英名",
+        "address": "本社所在地",
+        "representative": "社長氏名",
+    }
+    _float_fields = {
+        "current_assets": "流動資産",
+        "investment_securities": "有価証券",
+        "liabilities": "負債合計",
+        "issued_shares": "発行株式数",
+        "employees_consolidated": "従業員数(グループ)",
+        "employees": "従業員数(単体)",
+        "average_length_of_service": "平均勤続年数",
+        "average_age": "平均年齢",
+        "average_salary": "従業員平均年収",
+        "eps_ifrs": "一株利益IFRS",
+        "eps": "一株利益",
+    }
+
+    # 取締役の名前の一覧は保持せず、集計値のみ
+    _aggregate_fields = [
+        "board_member_count",
+        "board_member_reward_total",
+    ]
+    # 誕生日は年齢が計算する日で変わるので、日付のまま ("YYYY-MM-DD,YYYY-MM-DD,...")
+    _joined_fields = [
+        "board_member_birthdays",
+    ]
+    _derived_fields = [
+        "score_per_stock",
+        "earnings_loss_per_stock",
+        "employee_earning_power",
+        "average_board_member_reward",
+    ]
+
+    __slots__ = tuple(_str_fields) + tuple(_float_fields) + tuple(_aggregate_fields) + tuple(_joined_fields) + tuple(_derived_fields)
+
+    @classmethod
+    def get_fields(cls) -> list[str]:
+        return list(cls.__slots__)
+
+    @classmethod
+    def get_numeric_fields(cls) -> list[str]:
+        return list(cls._float_fields) + cls._aggregate_fields + cls._derived_fields
+
+    @staticmethod
+    def is_missing(value: str | float) -> bool:
+        if isinstance(value, str):
+            return len(value) == 0
+        return math.isnan(value)
+
+    @staticmethod
+    def _to_float(value: str) -> float:
+        # 空・不正値はNaN
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    @staticmethod
+    def _divide(numerator: float, denominator: float) -> float:
+        # 0除算はnumpyと同じくinf/NaN
+        if denominator == 0:
+            if numerator == 0 or math.isnan(numerator):
+                return math.nan
+            return math.copysign(math.inf, numerator)
+        return numerator / denominator
+
+    @staticmethod
+    def fill(value: float, default: float) -> float:
+        # 欠損値を既定値で置き換える
+        return default if math.isnan(value) else value
+
+    @classmethod
+    def from_result(cls, result: dict) -> "FundamentalsRecord":
+
+        # 文字列 -> 数値の変換は生成時に一度だけ
+        record = cls.__new__(cls)
+        for field, name in cls._str_fields.items():
+            setattr(record, field, result[name])
+        for field, name in cls._float_fields.items():
+            setattr(record, field, cls._to_float(result[name]))
+
+        try:
+            record.board_member_count = float(sum(int(number) for number in result["取締役人数"]))
+            record.board_member_reward_total = float(sum(float(reward) for reward in result["取締役報酬合計"]))
+        except ValueError:
+            record.board_member_count = math.nan
+            record.board_member_reward_total = math.nan
+
+        # 人数の記載が無ければ名前・誕生日の数から
+        if record.board_member_count == 0:
+            if len(result["取締役名"]) > 0:
+                record.board_member_count = float(len(result["取締役名"]))
+            if len(result["取締役誕生日"]) > 0:
+                record.board_member_count = float(len(result["取締役誕生日"]))
+
+        record.board_member_birthdays = ",".join(birthday_str for birthday_str in result["取締役誕生日"] if birthday_str)
+
+        record._compute_derived()
+        return record
+
+    def get_board_member_birthdays(self) -> list[datetime]:
+        birthdays = []
+        for birthday_str in self.board_member_birthdays.split(","):
+            try:
+                birthdays.append(datetime.strptime(birthday_str, "%Y-%m-%d"))
+            except ValueError:
+                continue
+        return birthdays
+
+    def _compute_derived(self):
+
+        # 純流動資産 (有価証券は6割評価) / 発行株式数
+        net_current_assets = (
+            self.fill(self.current_assets, 0.0) + self.fill(self.investment_securities, 0.0) * 0.6 - self.fill(self.liabilities, 0.0)
+        )
+        self.score_per_stock = self._divide(net_current_assets, self.fill(self.issued_shares, 1.0))
+
+        # 日本基準があれば優先
+        self.earnings_loss_per_stock = self.fill(self.eps if not math.isnan(self.eps) else self.eps_ifrs, 0.0)
+
+        # 従業員一人当たり利益 / 平均年収
+        earnings_per_employee = self._divide(self.earnings_loss_per_stock * self.fill(self.issued_shares, 0.0), self.employees)
+        self.employee_earning_power = self._divide(earnings_per_employee, self.average_salary)
+
+        # 人数が分からない場合は1人とみなす
+        if math.isnan(self.board_member_count) or math.isnan(self.board_member_reward_total):
+            self.average_board_member_reward = math.nan
+        else:
+            self.average_board_member_reward = self.board_member_reward_total / (self.board_member_count if self.board_member_count > 0 else 1.0)
+
+    def to_tuple(self) -> tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    @classmethod
+    def from_tuple(cls, values: tuple | list) -> "FundamentalsRecord":
+        record = cls.__new__(cls)
+        for field, value in zip(cls.__slots__, values):
+            setattr(record, field, value)
+        return record
+
+    def __getstate__(self):
+        return self.to_tuple()
+
+    def __setstate__(self, state: tuple):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
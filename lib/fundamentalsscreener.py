@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pandas as pd
+from .fundamentalsrecord import FundamentalsRecord
+
+
+class FundamentalsScreener:
+
+    def _build_frame(self, parse_results: dict[str, FundamentalsRecord], security_codes: dict[str, str]) -> pd.DataFrame:
+
+        xbrl_paths = list(parse_results.keys())
+        records = list(parse_results.values())
+
+        # {edinet_code}_{submit_day}_{doc_id}.xbrl (アーカイブ内の書類は # 以降がファイル名)
+        filenames = [os.path.basename(xbrl_path.split("#")[-1]) for xbrl_path in xbrl_paths]
+
+        df = pd.DataFrame(
+            {
+                "xbrl_path": xbrl_paths,
+                "edinet_code": [filename.split("_")[0] for filename in filenames],
+                "doc_id": [os.path.splitext(filename)[0].split("_")[-1] for filename in filenames],
+                "company_name": [record.company_name for record in records],
+                "security_code": [record.security_code for record in records],
+                "filing_date": [record.filing_date for record in records],
+            }
+        )
+
+        # xbrlに証券コードが無ければ提出時の情報で補完
+        missing = df["security_code"] == ""
+        df.loc[missing, "security_code"] = df.loc[missing, "doc_id"].map(security_codes).fillna("")
+
+        # 数値・派生指標はレコード生成時に計算済み (欠損はNaN)
+        for column in FundamentalsRecord.get_numeric_fields():
+            df[column] = np.fromiter((getattr(record, column) for record in records), dtype=np.float64, count=len(records))
+
+        return df
+
+    def __init__(self, parse_results: dict[str, FundamentalsRecord], security_codes: dict[str, str] | None = None):
+        self._df = self._build_frame(parse_results, security_codes if security_codes is not None else {})
+
+    def get_frame(self) -> pd.DataFrame:
+        return self._df
+
+    @staticmethod
+    def apply_prices(df: pd.DataFrame, stock_prices: pd.Series) -> pd.DataFrame:
+
+        # stock_prices: df.index -> 株価
+        df = df.copy()
+        df["stock_price"] = stock_prices.reindex(df.index).astype(np.float64)
+        df["score_ratio"] = df["score_per_stock"] / df["stock_price"]
+        df["per"] = df["stock_price"] / df["earnings_loss_per_stock"]
+        df["critical_ratio"] = df["score_ratio"] / df["per"]
+        return df
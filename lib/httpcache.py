@@ -0,0 +1,70 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class HttpResponseCache:
+
+    def _create_tables(self):
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, fetched_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, filename: str = "http_cache.sqlite3"):
+        self._path = os.path.join(cache_dir, filename)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._create_tables()
+        self._hits = 0
+        self._misses = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_stats(self) -> tuple[int, int]:
+        # (hits, misses)
+        return (self._hits, self._misses)
+
+    def get(self, key: str, ttl_seconds: float) -> str | None:
+
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+            # 期限切れは無いものとして扱う
+            if row is None or now - row[1] > ttl_seconds:
+                self._misses += 1
+                return None
+
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._hits += 1
+            return row[0]
+
+    def put(self, key: str, body: str):
+
+        now = time.time()
+        size = len(body.encode("utf-8"))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, fetched_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, body, size, now, now),
+            )
+
+            # 上限を超えたら最後に使われたのが古い順に削除
+            total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self._max_bytes:
+                rows = self._connection.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+                evict_keys = []
+                for evict_key, evict_size in rows:
+                    if total_size <= self._max_bytes:
+                        break
+                    evict_keys.append((evict_key,))
+                    total_size -= evict_size
+                self._connection.executemany("DELETE FROM responses WHERE key = ?", evict_keys)
@@ -0,0 +1,184 @@
+import time
+import asyncio
+import threading
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from .httpcache import HttpResponseCache
+from .metrics import Metrics
+
+
+class TokenBucket:
+
+    def __init__(self, rate_per_second: float, capacity: float = 1.0):
+        self._rate = rate_per_second
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+
+        # トークンを先に予約して、足りない分だけ待つ (ビジーウェイトしない)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1.0
+            wait_seconds = -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+
+class HttpClient:
+
+    _shared_client = None
+    _shared_lock = threading.Lock()
+
+    # ホスト毎の既定レート (リクエスト/秒, バースト)
+    _default_rate_limits = {
+        "finance.yahoo.co.jp": (2.0, 1.0),
+        "minkabu.jp": (2.0, 2.0),
+        "disclosure.edinet-fsa.go.jp": (5.0, 5.0),
+        "api.edinet-fsa.go.jp": (5.0, 5.0),
+    }
+
+    _retry_status_codes = {429, 500, 502, 503, 504}
+
+    def _get_bucket(self, url: str) -> TokenBucket | None:
+        host = urllib.parse.urlparse(url).hostname
+        with self._lock:
+            return self._buckets.get(host)
+
+    def __init__(
+        self,
+        timeout_seconds: float = 30.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        pool_maxsize: int = 16,
+        max_workers: int = 16,
+    ):
+        self._timeout_seconds = timeout_seconds
+        self._max_retries = max_retries
+        self._backoff_seconds = backoff_seconds
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        # ホスト毎に設定されたレート (倍率を掛ける前)
+        self._rate_limits: dict[str, tuple[float, float]] = {}
+        self._rate_limit_scale = 1.0
+        self._cache: HttpResponseCache | None = None
+        for host, (rate_per_second, capacity) in self._default_rate_limits.items():
+            self.set_rate_limit(host, rate_per_second, capacity)
+
+        # keep-aliveの接続をホスト毎にプール
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self._default_rate_limits), pool_maxsize=pool_maxsize)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # 非同期APIはスレッドプール上で同期APIを呼ぶ
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @classmethod
+    def get_shared(cls) -> "HttpClient":
+        with cls._shared_lock:
+            if cls._shared_client is None:
+                cls._shared_client = HttpClient()
+            return cls._shared_client
+
+    def _create_bucket(self, rate_per_second: float, capacity: float) -> TokenBucket:
+        return TokenBucket(rate_per_second * self._rate_limit_scale, max(1.0, capacity * self._rate_limit_scale))
+
+    def set_rate_limit(self, host: str, rate_per_second: float, capacity: float = 1.0):
+        with self._lock:
+            self._rate_limits[host] = (rate_per_second, capacity)
+            self._buckets[host] = self._create_bucket(rate_per_second, capacity)
+
+    def set_default_rate_limit(self, host: str, rate_per_second: float, capacity: float = 1.0) -> bool:
+
+        # 設定済みのホストはそのまま (バケットを作り直すと待ち時間がリセットされる)
+        with self._lock:
+            if host in self._rate_limits:
+                return False
+            self._rate_limits[host] = (rate_per_second, capacity)
+            self._buckets[host] = self._create_bucket(rate_per_second, capacity)
+            return True
+
+    def set_rate_limit_scale(self, scale: float):
+
+        # 同じ接続元から複数プロセスで取得する場合に全体のレートを保つ (設定済み・今後設定するレート全てに掛かる)
+        with self._lock:
+            self._rate_limit_scale = scale
+            for host, (rate_per_second, capacity) in self._rate_limits.items():
+                self._buckets[host] = self._create_bucket(rate_per_second, capacity)
+
+    def get(self, url: str, params: dict | None = None, stream: bool = False) -> requests.Response:
+
+        bucket = self._get_bucket(url)
+        host = urllib.parse.urlparse(url).hostname
+        metrics = Metrics.get_shared()
+        for attempt in range(self._max_retries + 1):
+            if bucket is not None:
+                wait_seconds = bucket.acquire()
+                if wait_seconds > 0:
+                    metrics.increment(f"http.{host}.rate_limit_wait_seconds", wait_seconds)
+            if attempt > 0:
+                metrics.increment(f"http.{host}.retries")
+
+            is_last = attempt == self._max_retries
+            metrics.increment(f"http.{host}.requests")
+            try:
+                with metrics.timer(f"http.{host}"):
+                    response = self._session.get(url, params=params, timeout=self._timeout_seconds, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.increment(f"http.{host}.connection_errors")
+                if is_last:
+                    raise
+            else:
+                if not response.status_code in self._retry_status_codes or is_last:
+                    if response.status_code >= 400:
+                        metrics.increment(f"http.{host}.status_{response.status_code}")
+                    return response
+                response.close()
+
+            # 指数バックオフ
+            time.sleep(self._backoff_seconds * (2**attempt))
+
+    def set_cache(self, cache: HttpResponseCache | None):
+        self._cache = cache
+
+    def get_cache(self) -> HttpResponseCache | None:
+        return self._cache
+
+    def get_text(self, url: str, params: dict | None = None, cache_ttl_seconds: float | None = None, raise_for_status: bool = False) -> str:
+
+        # キャッシュはTTL指定時のみ使う, raise_for_status: エラーページの本文を返さずに例外にする
+        cache = self._cache if cache_ttl_seconds is not None else None
+        key = url if params is None else url + "?" + urllib.parse.urlencode(sorted(params.items()))
+        metrics = Metrics.get_shared()
+        if cache is not None:
+            text = cache.get(key, cache_ttl_seconds)
+            if text is not None:
+                metrics.increment("http.cache_hits")
+                return text
+            metrics.increment("http.cache_misses")
+
+        response = self.get(url, params)
+        metrics.increment(f"http.{urllib.parse.urlparse(url).hostname}.bytes", len(response.content))
+        if raise_for_status:
+            response.raise_for_status()
+        text = response.text
+        if cache is not None and response.status_code == 200:
+            cache.put(key, text)
+        return text
+
+    async def get_text_async(self, url: str, params: dict | None = None, cache_ttl_seconds: float | None = None, raise_for_status: bool = False) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.get_text(url, params, cache_ttl_seconds, raise_for_status))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class Metrics:
+
+    _shared_metrics = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_trace_events: int = 100000):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        # 名前 -> [回数, 合計秒, 最大秒]
+        self._timers: dict[str, list] = {}
+        # 名前 -> [(段階名, 入力数, 通過数), ...]
+        self._funnels: dict[str, list[tuple[str, int, int]]] = {}
+        # 直近のスパンのみ保持 (常時有効でもメモリが増え続けない)
+        self._trace_events: deque = deque(maxlen=max_trace_events)
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    @classmethod
+    def get_shared(cls) -> "Metrics":
+        with cls._shared_lock:
+            if cls._shared_metrics is None:
+                cls._shared_metrics = Metrics()
+            return cls._shared_metrics
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def add_time(self, name: str, start_time: float, elapsed_seconds: float):
+
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, elapsed_seconds, elapsed_seconds]
+            else:
+                timer[0] += 1
+                timer[1] += elapsed_seconds
+                timer[2] = max(timer[2], elapsed_seconds)
+            self._trace_events.append((name, start_time, elapsed_seconds, threading.get_ident()))
+
+    @contextmanager
+    def timer(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, start_time, time.perf_counter() - start_time)
+
+    def set_funnel(self, name: str, stages: list[tuple[str, int, int]]):
+        # stages: (段階名, 入力数, 通過数)
+        with self._lock:
+            self._funnels[name] = list(stages)
+
+    def get_counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_summary(self) -> dict:
+
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timers": {
+                    name: {"count": count, "total_seconds": total, "mean_seconds": total / count, "max_seconds": maximum}
+                    for name, (count, total, maximum) in self._timers.items()
+                },
+                "funnels": {
+                    name: [{"stage": stage, "input": input_count, "passed": pass_count, "rejected": input_count - pass_count} for stage, input_count, pass_count in stages]
+                    for name, stages in self._funnels.items()
+                },
+            }
+
+    def print_summary(self):
+
+        summary = self.get_summary()
+        print("--- metrics ---")
+        for name, timer in sorted(summary["timers"].items(), key=lambda item: -item[1]["total_seconds"]):
+            print(f"{name}: {timer['count']} calls, {timer['total_seconds']:.3f}s total, {timer['max_seconds']:.3f}s max")
+        for name, value in sorted(summary["counters"].items()):
+            print(f"{name}: {value:g}")
+        for name, stages in summary["funnels"].items():
+            print(f"funnel {name}:")
+            for stage in stages:
+                print(f"  {stage['stage']}: {stage['passed']}/{stage['input']} ({stage['rejected']} rejected)")
+
+    def write(self, path: str):
+
+        # chrome://tracing や Perfetto でそのまま開ける形式 (traceEvents以外のキーは無視される)
+        summary = self.get_summary()
+        with self._lock:
+            events = list(self._trace_events)
+        summary["traceEvents"] = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start_time - self._origin) * 1e6,
+                "dur": elapsed_seconds * 1e6,
+                "pid": self._pid,
+                "tid": thread_id,
+            }
+            for name, start_time, elapsed_seconds, thread_id in events
+        ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def report_at_exit(self, path: str | None = None):
+
+        # 終了時に集計を表示して、指定があればファイルにも書き出す
+        def report():
+            self.print_summary()
+            if path is not None:
+                self.write(path)
+
+        atexit.register(report)
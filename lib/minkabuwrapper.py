@@ -1,41 +1,200 @@
+import math
+from typing import Callable, NamedTuple, TypeVar
 from bs4 import BeautifulSoup
-import requests
+from .httpclient import HttpClient
+from .metrics import Metrics
+
+# lxmlがあれば高速なパーサーを使う
+try:
+    import lxml  # noqa: F401
+
+    _parser_features = "lxml"
+except ImportError:
+    _parser_features = "html.parser"
+
+T = TypeVar("T")
+
+
+class MinkabuParseError(ValueError):
+    # 取得できたページから絞り込みに使う項目が見つからない (ページの構成が変わった等)
+    pass
+
+
+class MinkabuStockInfo(NamedTuple):
+    name: str
+    target_price: float
+    industry_name: str
+    research_analysis: str
+    pick_diag: str
 
 
 class MinkabuWrapper:
-    def __init__(self, company_code: str) -> None:
-        url = f"https://minkabu.jp/stock/{company_code}"
-        response = requests.get(url)
-        self._soup = BeautifulSoup(response.text, "html.parser")
+    # 業種・診断ラベルは頻繁には変わらない
+    _default_cache_ttl_seconds = 24 * 60 * 60
+
+    # 兄弟要素を拾うために目印の後ろを読む範囲
+    _fragment_window = 2048
+
+    _industry_class = "md_ico_tx theme_link size_s md_head_icon"
+
+    _base_url = "https://minkabu.jp"
+
+    def __init__(
+        self,
+        company_code: str,
+        http_client: HttpClient | None = None,
+        html: str | None = None,
+        cache_ttl_seconds: float = _default_cache_ttl_seconds,
+    ) -> None:
+        # ページはgetterで必要になるまで取得しない
         self._company_code = company_code
+        self._http_client = http_client
+        self._html = html
+        self._cache_ttl_seconds = cache_ttl_seconds
+        self._stock_info: MinkabuStockInfo | None = None
+
+    @classmethod
+    def set_base_url(cls, base_url: str):
+        # 取得先の差し替え (ローカルの代替サーバーなど)
+        cls._base_url = base_url.rstrip("/")
+
+    @classmethod
+    def get_url(cls, company_code: str) -> str:
+        return f"{cls._base_url}/stock/{company_code}"
+
+    @classmethod
+    async def create_async(
+        cls,
+        company_code: str,
+        http_client: HttpClient | None = None,
+        cache_ttl_seconds: float = _default_cache_ttl_seconds,
+    ) -> "MinkabuWrapper":
+        # 複数社のページ取得を重ねて実行するため
+        http_client = http_client if http_client is not None else HttpClient.get_shared()
+        html = await http_client.get_text_async(cls.get_url(company_code), cache_ttl_seconds=cache_ttl_seconds, raise_for_status=True)
+        wrapper = cls(company_code, html=html)
+        wrapper.get_stock_info()
+        return wrapper
+
+    def _get_html(self) -> str:
+        if self._html is None:
+            http_client = self._http_client if self._http_client is not None else HttpClient.get_shared()
+            self._html = http_client.get_text(self.get_url(self._company_code), cache_ttl_seconds=self._cache_ttl_seconds, raise_for_status=True)
+        return self._html
+
+    def _parse_fragment(self, html: str, marker: str, tag_name: str, close_tag: str | None) -> BeautifulSoup | None:
+
+        # 目印を含む要素の周辺だけをパースする
+        marker_index = html.find(marker)
+        if marker_index < 0:
+            return None
+        start = html.rfind("<" + tag_name, 0, marker_index)
+        if start < 0:
+            return None
+
+        end = -1
+        if close_tag is not None:
+            end = html.find(close_tag, marker_index)
+        if end < 0:
+            end = marker_index + self._fragment_window
+        else:
+            end += len(close_tag)
+        return BeautifulSoup(html[start:end], _parser_features)
+
+    def _extract_label(self, soup: BeautifulSoup, path: str) -> str | None:
+
+        # リンク自体が無い銘柄は "None" (診断が無い), リンクはあるがラベルが無ければ見つからない扱い
+        root = soup.find("a", href=f"/stock/{self._company_code}/{path}")
+        if root is None:
+            return "None"
+        label_prev = root.find("p", class_="label")
+        if label_prev is None:
+            return None
+        label = label_prev.find_next_sibling()
+        return label.text if label is not None else None
+
+    @staticmethod
+    def _extract_name(soup: BeautifulSoup) -> str | None:
+        tag = soup.find("p", class_="md_stockBoard_stockName")
+        return tag.text if tag is not None else None
+
+    @staticmethod
+    def _extract_target_price(soup: BeautifulSoup) -> float | None:
+        tag = soup.find("div", class_="md_target_box_price")
+        if tag is None:
+            return None
+        # 要素はあるが値が無い ("---" など)
+        try:
+            return float(tag.text.replace(",", ""))
+        except ValueError:
+            return math.nan
+
+    @classmethod
+    def _extract_industry_name(cls, soup: BeautifulSoup) -> str | None:
+        industry_prev = soup.find("span", class_=cls._industry_class)
+        if industry_prev is None:
+            return None
+        industry = industry_prev.find_next_sibling()
+        return industry.text if industry is not None else None
+
+    def _parse_stock_info(self, html: str) -> MinkabuStockInfo:
+
+        metrics = Metrics.get_shared()
+        full_soups = []
+
+        def extract(
+            field: str, marker: str, tag_name: str, close_tag: str | None, extractor: Callable[[BeautifulSoup], T | None], default: T | None
+        ) -> T:
+            # default: Noneなら必須の項目 (見つからなければ例外にして、既定値で条件を素通りさせない)
+
+            # 目印の周辺だけで見つからなければページ全体をパースし直す
+            fragment = self._parse_fragment(html, marker, tag_name, close_tag)
+            value = extractor(fragment) if fragment is not None else None
+            if value is None:
+                metrics.increment("minkabu.fragment_fallbacks")
+                if len(full_soups) == 0:
+                    full_soups.append(BeautifulSoup(html, _parser_features))
+                value = extractor(full_soups[0])
+
+            # それでも無ければページの構成が変わった可能性がある (空のラベルで条件を素通りしないよう記録)
+            if value is None:
+                metrics.increment("minkabu.missing:" + field)
+                if default is None:
+                    raise MinkabuParseError(f"{field} not found: {self._company_code}")
+                return default
+            return value
+
+        research_url = f"/stock/{self._company_code}/research"
+        pick_url = f"/stock/{self._company_code}/pick"
+        return MinkabuStockInfo(
+            extract("name", "md_stockBoard_stockName", "p", "</p>", self._extract_name, ""),
+            extract("target_price", "md_target_box_price", "div", "</div>", self._extract_target_price, math.nan),
+            extract("industry_name", self._industry_class, "span", None, self._extract_industry_name, None),
+            extract("research_analysis", f'href="{research_url}"', "a", "</a>", lambda soup: self._extract_label(soup, "research"), None),
+            extract("pick_diag", f'href="{pick_url}"', "a", "</a>", lambda soup: self._extract_label(soup, "pick"), None),
+        )
+
+    def get_stock_info(self) -> MinkabuStockInfo:
+
+        # 一度抽出したらページ本体は保持しない
+        if self._stock_info is None:
+            html = self._get_html()
+            with Metrics.get_shared().timer("minkabu.parse"):
+                self._stock_info = self._parse_stock_info(html)
+            self._html = None
+        return self._stock_info
 
     def get_name(self) -> str:
-        name = self._soup.find("p", class_="md_stockBoard_stockName")
-        return name.text
+        return self.get_stock_info().name
 
     def get_target_price(self) -> float:
-        target_price = self._soup.find("div", class_="md_target_box_price")
-        return float(target_price.text.replace(",", ""))
+        return self.get_stock_info().target_price
 
     def get_research_analysis(self) -> str:
-        research_url = f"/stock/{self._company_code}/research"
-        research_root = self._soup.find("a", href=research_url)
-        if research_root is None:
-            return "None"
-        research_analysis_prev = research_root.find("p", class_="label")
-        research_analysis = research_analysis_prev.find_next_sibling()
-        return research_analysis.text
+        return self.get_stock_info().research_analysis
 
     def get_pick_diag(self) -> str:
-        pick_url = f"/stock/{self._company_code}/pick"
-        pick_root = self._soup.find("a", href=pick_url)
-        if pick_root is None:
-            return "None"
-        pick_diag_prev = pick_root.find("p", class_="label")
-        pick_diag = pick_diag_prev.find_next_sibling()
-        return pick_diag.text
+        return self.get_stock_info().pick_diag
 
     def get_industry_name(self) -> str:
-        industry_prev = self._soup.find("span", class_="md_ico_tx theme_link size_s md_head_icon")
-        industry = industry_prev.find_next_sibling()
-        return industry.text
+        return self.get_stock_info().industry_name
@@ -0,0 +1,206 @@
+import os
+import time
+import sqlite3
+import threading
+import pandas as pd
+import pyarrow
+import pyarrow.parquet
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# 別プロセスからの書き込みと排他する (無い環境ではプロセス内のみ)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class PriceHistoryStore:
+
+    _price_columns = ["open", "high", "low", "close", "adj_close", "volume"]
+    _schema = pyarrow.schema([("ticker", pyarrow.string()), ("date", pyarrow.date32())] + [(column, pyarrow.float64()) for column in _price_columns])
+    _coverage_schema = pyarrow.schema([("ticker", pyarrow.string()), ("start", pyarrow.string()), ("end", pyarrow.string())])
+
+    # 株価は追記毎に別ファイルに書き、ファイルが増えたら1つにまとめる (後に書いた行が優先)
+    _part_prefix = "part-"
+    _part_suffix = ".parquet"
+    _max_parts = 16
+    # 銘柄・日付順に書いて、行グループ毎の範囲で読まない部分を飛ばす
+    _row_group_size = 64 * 1024
+
+    def __init__(self, cache_dir: str, dirname: str = "price_history", legacy_filename: str = "price_history.sqlite3"):
+        self._path = os.path.join(cache_dir, dirname)
+        self._coverage_path = os.path.join(self._path, "coverage.parquet")
+        self._lock_path = os.path.join(self._path, "lock")
+        self._lock = threading.Lock()
+        os.makedirs(self._path, exist_ok=True)
+        self._import_sqlite(os.path.join(cache_dir, legacy_filename))
+
+    def close(self):
+        # ファイルは読み書きの度に開くので保持しているものは無い
+        pass
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _import_sqlite(self, sqlite_path: str):
+
+        # 以前のSQLiteに保存した株価・取得済み期間を一度だけ移す
+        if not os.path.exists(sqlite_path):
+            return
+        with self._locked(True):
+            if os.path.exists(self._coverage_path) or len(self._list_parts()) > 0:
+                return
+            connection = sqlite3.connect(sqlite_path)
+            try:
+                history = pd.read_sql_query("SELECT * FROM prices", connection)
+                coverage = pd.read_sql_query("SELECT ticker, start, end FROM coverage", connection)
+            finally:
+                connection.close()
+            if len(history) > 0:
+                self._write_table(self._get_new_part_path(), self._to_table(history))
+            self._write_coverage(coverage)
+
+    def _list_parts(self) -> list[str]:
+        # 書いた順 (ファイル名は書いた時刻)
+        names = sorted(name for name in os.listdir(self._path) if name.startswith(self._part_prefix) and name.endswith(self._part_suffix))
+        return [os.path.join(self._path, name) for name in names]
+
+    def _get_new_part_path(self) -> str:
+        return os.path.join(self._path, f"{self._part_prefix}{time.time_ns():020d}-{os.getpid()}{self._part_suffix}")
+
+    def _write_table(self, path: str, table: pyarrow.Table):
+        # 書き終わるまでは別名にして、途中の状態のファイルを読ませない
+        temp_path = path + ".tmp"
+        pyarrow.parquet.write_table(table, temp_path, row_group_size=self._row_group_size)
+        os.replace(temp_path, path)
+
+    def _to_table(self, history: pd.DataFrame) -> pyarrow.Table:
+
+        # 同じ銘柄・日付はこの中でも後の行を優先
+        frame = pd.DataFrame({"ticker": history["ticker"].astype(str), "date": pd.to_datetime(history["date"])})
+        for column in self._price_columns:
+            frame[column] = history[column].astype("float64") if column in history.columns else float("nan")
+        frame = frame.drop_duplicates(["ticker", "date"], keep="last").sort_values(["ticker", "date"])
+        return pyarrow.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+
+    def _read_coverage(self) -> pd.DataFrame:
+        if not os.path.exists(self._coverage_path):
+            return pd.DataFrame({"ticker": pd.Series(dtype=str), "start": pd.Series(dtype=str), "end": pd.Series(dtype=str)})
+        return pyarrow.parquet.read_table(self._coverage_path).to_pandas()
+
+    def _write_coverage(self, coverage: pd.DataFrame):
+        table = pyarrow.Table.from_pandas(coverage[["ticker", "start", "end"]], schema=self._coverage_schema, preserve_index=False)
+        self._write_table(self._coverage_path, table)
+
+    def get_missing_ranges(self, tickers: list[str], start_date_str: str, end_date_str: str) -> dict[tuple[str, str], list[str]]:
+
+        with self._locked(False):
+            rows = self._read_coverage()
+        coverage = {ticker: (start, end) for ticker, start, end in zip(rows["ticker"], rows["start"], rows["end"])}
+
+        # 同じ期間が足りない銘柄をまとめて一度に取得できるようにする
+        missing: dict[tuple[str, str], list[str]] = {}
+        for ticker in tickers:
+            ranges = []
+            if not ticker in coverage:
+                ranges.append((start_date_str, end_date_str))
+            else:
+                covered_start, covered_end = coverage[ticker]
+                if start_date_str < covered_start:
+                    ranges.append((start_date_str, self._shift_date_str(covered_start, -1)))
+                if covered_end < end_date_str:
+                    ranges.append((self._shift_date_str(covered_end, 1), end_date_str))
+            for date_range in ranges:
+                missing.setdefault(date_range, []).append(ticker)
+        return missing
+
+    @staticmethod
+    def _shift_date_str(date_str: str, days: int) -> str:
+        return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+    def put_history(self, history: pd.DataFrame):
+
+        # history: ticker, date (YYYY-MM-DD), open, high, low, close, adj_close, volume
+        if len(history) == 0:
+            return
+        table = self._to_table(history)
+        with self._locked(True):
+            self._write_table(self._get_new_part_path(), table)
+            parts = self._list_parts()
+            if len(parts) > self._max_parts:
+                self._compact(parts)
+
+    def _compact(self, parts: list[str]):
+
+        # まとめたファイルは最後に書いたものとして扱う (元の行より後の名前)
+        history = self._read_parts(parts, None, None, None, None)
+        self._write_table(self._get_new_part_path(), pyarrow.Table.from_pandas(history, schema=self._schema, preserve_index=False))
+        for path in parts:
+            os.remove(path)
+
+    def add_coverage(self, tickers: list[str], start_date_str: str, end_date_str: str):
+
+        # 取得済み期間は隣接・重複する範囲のみ取りに行くので和集合をとる
+        added = pd.DataFrame({"ticker": sorted(set(tickers)), "start": start_date_str, "end": end_date_str})
+        with self._locked(True):
+            coverage = pd.concat([self._read_coverage(), added])
+            self._write_coverage(coverage.groupby("ticker", as_index=False).agg(start=("start", "min"), end=("end", "max")))
+
+    def _read_parts(self, parts: list[str], tickers: list[str] | None, start_date_str: str | None, end_date_str: str | None, columns: list[str] | None) -> pd.DataFrame:
+
+        filters = []
+        if tickers is not None:
+            filters.append(("ticker", "in", tickers))
+        if start_date_str is not None:
+            filters.append(("date", ">=", datetime.strptime(start_date_str, "%Y-%m-%d").date()))
+        if end_date_str is not None:
+            filters.append(("date", "<=", datetime.strptime(end_date_str, "%Y-%m-%d").date()))
+        names = ["ticker", "date"] + (self._price_columns if columns is None else columns)
+        tables = [pyarrow.parquet.read_table(path, columns=names, filters=filters if len(filters) > 0 else None) for path in parts]
+        if len(tables) == 0:
+            return self._schema.empty_table().select(names).to_pandas(date_as_object=False)
+
+        history = pyarrow.concat_tables(tables).to_pandas(date_as_object=False)
+        # 複数のファイルにある同じ銘柄・日付は後に書いた行を使う
+        if len(tables) > 1:
+            history = history.drop_duplicates(["ticker", "date"], keep="last").sort_values(["ticker", "date"], ignore_index=True)
+        return history
+
+    def get_history(self, tickers: list[str], start_date_str: str, end_date_str: str, columns: list[str] | None = None) -> pd.DataFrame:
+
+        # 銘柄・日付順, dateはdatetime64 (columns指定時はその列のみ読む)
+        with self._locked(False):
+            return self._read_parts(self._list_parts(), list(tickers), start_date_str, end_date_str, columns)
+
+    def get_prices_as_of(self, queries: pd.DataFrame, column: str = "close", lookback_days: int = 14) -> pd.Series:
+
+        # queries: ticker, date (YYYY-MM-DD) -> 各日付以前で直近の価格 (休場日は前営業日)
+        if len(queries) == 0:
+            return pd.Series(dtype=float, index=queries.index)
+
+        start_date_str = self._shift_date_str(queries["date"].min(), -lookback_days)
+        history = self.get_history(sorted(queries["ticker"].unique()), start_date_str, queries["date"].max(), columns=[column])
+        history = history.dropna(subset=[column])
+
+        left = queries[["ticker", "date"]].copy()
+        left["date"] = pd.to_datetime(left["date"]).astype(history["date"].dtype)
+        left["_order"] = range(len(left))
+        merged = pd.merge_asof(
+            left.sort_values("date"),
+            history[["ticker", "date", column]].sort_values("date"),
+            on="date",
+            by="ticker",
+            direction="backward",
+            tolerance=pd.Timedelta(days=lookback_days),
+        )
+        merged = merged.sort_values("_order")
+        return pd.Series(merged[column].to_numpy(), index=queries.index)
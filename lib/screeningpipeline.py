@@ -0,0 +1,173 @@
+import time
+import pandas as pd
+from typing import Callable, Iterator
+from .metrics import Metrics
+
+
+class ScreeningSource:
+
+    # cost: 0=ローカル, 大きいほど高コスト (ネットワーク等), inputs: 取得に必要な列, outputs: 取得して追加する列
+    def __init__(
+        self,
+        name: str,
+        cost: int,
+        fetch: Callable[[pd.DataFrame], pd.DataFrame] | None = None,
+        inputs: list[str] | None = None,
+        outputs: list[str] | None = None,
+    ):
+        self.name = name
+        self.cost = cost
+        self._fetch = fetch
+        self.inputs = inputs if inputs is not None else []
+        self.outputs = outputs if outputs is not None else []
+
+    def fetch(self, df: pd.DataFrame) -> pd.DataFrame:
+        # dfの行についてこのソースの列を追加して返す
+        if self._fetch is None:
+            return df
+        return self._fetch(df)
+
+
+class ScreeningStage:
+
+    # inputs: 条件が参照する列, selectivity: 通過する割合の見込み (実行して分かるまでの並び順に使う, 省略時は1.0)
+    def __init__(
+        self,
+        name: str,
+        source: str,
+        predicate: Callable[[pd.DataFrame], pd.Series],
+        enabled: bool = True,
+        selectivity: float | None = None,
+        inputs: list[str] | None = None,
+    ):
+        self.name = name
+        self.source = source
+        self.predicate = predicate
+        self.enabled = enabled
+        self.selectivity = selectivity
+        self.inputs = inputs if inputs is not None else []
+
+
+class ScreeningPipeline:
+
+    def __init__(self, sources: list[ScreeningSource], stages: list[ScreeningStage], name: str = "screening"):
+        self._name = name
+        self._sources = {source.name: source for source in sources}
+        for stage in stages:
+            if not stage.source in self._sources:
+                raise ValueError(f"unknown source: {stage.source} ({stage.name})")
+        self._stages = stages
+        # 列名 -> その列を追加するソース
+        self._providers = {column: source.name for source in sources for column in source.outputs}
+        self._stats: list[tuple[str, int, int, float]] = []
+        # 段階名 -> [入力数, 通過数] (このパイプラインで実行した分の累計)
+        self._observed: dict[str, list[int]] = {}
+
+    def get_selectivity(self, stage: ScreeningStage) -> float:
+        # 実行済みなら実際に通過した割合、無ければ宣言した見込み
+        observed = self._observed.get(stage.name)
+        if observed is not None and observed[0] > 0:
+            return observed[1] / observed[0]
+        return stage.selectivity if stage.selectivity is not None else 1.0
+
+    def get_ordered_stages(self) -> list[ScreeningStage]:
+        # 安いソースの条件から順に、同じコストなら多く落とす条件から (同じ割合なら宣言順)
+        stages = [stage for stage in self._stages if stage.enabled]
+        return sorted(stages, key=lambda stage: (self._sources[stage.source].cost, self.get_selectivity(stage)))
+
+    def _fetch_source(self, df: pd.DataFrame, name: str, fetched_sources: set, stats: list) -> pd.DataFrame:
+
+        if name in fetched_sources:
+            return df
+        fetched_sources.add(name)
+
+        # 取得に必要な列を先に用意 (その列を使う条件が無効でも取得する)
+        source = self._sources[name]
+        df = self._provide_columns(df, source.inputs, fetched_sources, stats)
+        if len(df) == 0:
+            return df
+
+        start_time = time.perf_counter()
+        input_count = len(df)
+        df = source.fetch(df)
+        elapsed_seconds = time.perf_counter() - start_time
+        Metrics.get_shared().add_time("pipeline.fetch:" + name, start_time, elapsed_seconds)
+        stats.append(("fetch:" + name, input_count, len(df), elapsed_seconds))
+        return df
+
+    def _provide_columns(self, df: pd.DataFrame, columns: list[str], fetched_sources: set, stats: list) -> pd.DataFrame:
+
+        for column in columns:
+            if column in df.columns:
+                continue
+            provider = self._providers.get(column)
+            if provider is None:
+                raise ValueError(f"no source provides column: {column}")
+            df = self._fetch_source(df, provider, fetched_sources, stats)
+        return df
+
+    def _run_stages(self, df: pd.DataFrame) -> tuple[pd.DataFrame, list[tuple[str, int, int, float]]]:
+
+        stats = []
+        metrics = Metrics.get_shared()
+        fetched_sources = set()
+        for stage in self.get_ordered_stages():
+            if len(df) == 0:
+                break
+
+            # 前の段階を通過した行についてのみデータを取得
+            df = self._fetch_source(df, stage.source, fetched_sources, stats)
+            df = self._provide_columns(df, stage.inputs, fetched_sources, stats)
+            if len(df) == 0:
+                break
+
+            start_time = time.perf_counter()
+            input_count = len(df)
+            mask = stage.predicate(df).fillna(False).astype(bool)
+            df = df[mask]
+            elapsed_seconds = time.perf_counter() - start_time
+            metrics.add_time("pipeline." + stage.name, start_time, elapsed_seconds)
+            stats.append((stage.name, input_count, len(df), elapsed_seconds))
+            observed = self._observed.setdefault(stage.name, [0, 0])
+            observed[0] += input_count
+            observed[1] += len(df)
+
+        return df, stats
+
+    def _set_funnel(self):
+        # 各条件で何社落ちたか (データ取得の段階は除く)
+        funnel = [(name, input_count, pass_count) for name, input_count, pass_count, seconds in self._stats if not name.startswith("fetch:")]
+        Metrics.get_shared().set_funnel(self._name, funnel)
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+
+        df, self._stats = self._run_stages(df)
+        self._set_funnel()
+        return df
+
+    def run_chunks(self, df: pd.DataFrame, chunk_size: int = 500) -> Iterator[pd.DataFrame]:
+
+        # chunk_size行ずつ全段階を通して、通過した行を順に返す (取得したページ等を全社分は溜めない)
+        # 前の塊で多く落とした条件ほど次の塊では先に評価する
+        self._stats = []
+        for start in range(0, len(df), chunk_size):
+            survivors, stats = self._run_stages(df.iloc[start : start + chunk_size])
+
+            # 段階毎の件数・時間はそれまでの塊と合算
+            totals = {name: [input_count, pass_count, seconds] for name, input_count, pass_count, seconds in self._stats}
+            for name, input_count, pass_count, seconds in stats:
+                total = totals.setdefault(name, [0, 0, 0.0])
+                total[0] += input_count
+                total[1] += pass_count
+                total[2] += seconds
+            self._stats = [(name, input_count, pass_count, seconds) for name, (input_count, pass_count, seconds) in totals.items()]
+            self._set_funnel()
+            yield survivors
+
+    def get_stats(self) -> list[tuple[str, int, int, float]]:
+        # (段階名, 入力数, 通過数, 秒)
+        return self._stats
+
+    def print_stats(self):
+        for name, input_count, pass_count, seconds in self._stats:
+            print(f"{name}: {pass_count}/{input_count} passed ({seconds:.3f}s)")
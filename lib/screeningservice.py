@@ -0,0 +1,265 @@
+import json
+import time
+import threading
+import urllib.parse
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .screenresult import TopKRanking
+from .valuescreen import ValueScreen
+from .yahoofinancewrapper import YahooFinanceJPWrapper, YahooFinanceWrapper
+
+
+class ScreeningService:
+
+    _label_columns = ["industry_name", "research_analysis", "pick_diag"]
+    _result_columns = [
+        "edinet_code",
+        "company_name",
+        "ticker",
+        "score_ratio",
+        "per",
+        "critical_ratio",
+        "stock_price",
+        "industry_name",
+        "research_analysis",
+        "pick_diag",
+        "labels_pending",
+    ]
+
+    # ラベルは会社毎の取得が遅いので塊毎に差し替えて、取得できた会社から使う
+    _label_chunk_size = 200
+
+    def __init__(
+        self,
+        fundamentals: pd.DataFrame,
+        yahoo_finance: YahooFinanceWrapper,
+        yahoo_finance_jp: YahooFinanceJPWrapper,
+        price_refresh_interval_seconds: float = 5 * 60,
+        label_refresh_interval_seconds: float = 24 * 60 * 60,
+    ):
+        self._fundamentals = fundamentals
+        self._yahoo_finance = yahoo_finance
+        self._yahoo_finance_jp = yahoo_finance_jp
+        self._price_refresh_interval_seconds = price_refresh_interval_seconds
+        self._label_refresh_interval_seconds = label_refresh_interval_seconds
+
+        # 株価を結合した表とラベルは参照を差し替えて更新 (読み取り側はロック不要)
+        self._priced: pd.DataFrame | None = None
+        self._labels = pd.DataFrame(columns=self._label_columns)
+        self._labels_lock = threading.Lock()
+        self._labels_updated: float | None = None
+        # 取得に失敗した会社 (次にラベルを全て取り直すまで再取得しない)
+        self._failed_codes: set[str] = set()
+
+        # 証券コードの無い会社は、一度検索して分かったティッカーを以降も使う
+        self._resolved_tickers: dict[str, str] = {}
+
+        self._stop_event = threading.Event()
+        self._refresh_threads: list[threading.Thread] = []
+        self._server: ThreadingHTTPServer | None = None
+
+    def refresh_prices(self):
+
+        # 財務の条件に関係なく全社分を一括取得しておく
+        value_screen = ValueScreen(self._yahoo_finance, self._yahoo_finance_jp)
+        self._priced = value_screen.fetch_prices(self._fundamentals, self._resolved_tickers)
+
+    def _fetch_label_frame(self, company_codes: list[str]) -> pd.DataFrame:
+        value_screen = ValueScreen(self._yahoo_finance, self._yahoo_finance_jp)
+        fetched = value_screen.fetch_minkabu(pd.DataFrame({"company_code": company_codes}))
+        return fetched.set_index("company_code")[self._label_columns]
+
+    def _get_company_codes(self) -> list[str]:
+        # ティッカーの分かっている会社
+        priced = self._priced
+        if priced is None:
+            return []
+        return sorted(set(code for code in priced["company_code"] if len(code) > 0))
+
+    def _update_labels(self, company_codes: list[str]):
+
+        for start in range(0, len(company_codes), self._label_chunk_size):
+            if self._stop_event.is_set():
+                return
+            codes = company_codes[start : start + self._label_chunk_size]
+            fetched = self._fetch_label_frame(codes)
+            with self._labels_lock:
+                # 取得できなかった会社は前のラベルを残す
+                self._labels = pd.concat([self._labels[~self._labels.index.isin(fetched.index)], fetched])
+                self._failed_codes.update(set(codes) - set(fetched.index))
+
+    def fetch_missing_labels(self):
+        # 株価の更新で新しくティッカーが分かった会社の分のみ
+        labels = self._labels
+        codes = [code for code in self._get_company_codes() if not code in labels.index and not code in self._failed_codes]
+        self._update_labels(codes)
+
+    def refresh_labels(self):
+
+        # ティッカーの分かっている全社のラベルを取り直す (取得中・失敗時は前のラベルを使う)
+        self._failed_codes = set()
+        self._update_labels(self._get_company_codes())
+        self._labels_updated = time.monotonic()
+
+        # 見つからなかった会社名は1日毎に検索し直す
+        self._resolved_tickers = {name: ticker for name, ticker in self._resolved_tickers.items() if ticker != ""}
+
+    def _join_labels(self, df: pd.DataFrame) -> pd.DataFrame:
+
+        # 問い合わせではみんかぶを取得しない, まだラベルの無い会社は保留としてラベルの条件では落とさない
+        labels = self._labels
+        df = df.join(labels, on="company_code")
+        df["labels_pending"] = ~df["company_code"].isin(labels.index)
+        df[self._label_columns] = df[self._label_columns].fillna("")
+        return df
+
+    def _join_prices(self, df: pd.DataFrame) -> pd.DataFrame:
+        priced = self._priced
+        columns = [column for column in priced.columns if not column in df.columns]
+        return df.join(priced[columns])
+
+    def query(
+        self,
+        thresholds: dict | None = None,
+        enabled_stages: dict[str, bool] | None = None,
+        sort: str = "critical_ratio",
+        ascending: bool | None = None,
+        top: int = 20,
+    ) -> pd.DataFrame:
+
+        if self._priced is None:
+            self.refresh_prices()
+
+        # 株価・ラベルは保持しているものを使うので、条件を変えても再取得しない
+        value_screen = ValueScreen(self._yahoo_finance, self._yahoo_finance_jp, thresholds, enabled_stages)
+        pipeline = value_screen.create_pipeline({"yahoo": self._join_prices, "minkabu": self._join_labels})
+        companies = pipeline.run(self._fundamentals)
+
+        # 途中の段階で全て落ちると後の段階の列が無いので、結果の列に揃えてから並べる
+        if len(companies) == 0:
+            return companies.reindex(columns=self._result_columns)
+        # 並べる向きは省略時は指標から (perは小さい順)
+        ascending = ascending if ascending is not None else TopKRanking.get_default_ascending(sort)
+        companies = companies.sort_values(sort, ascending=ascending).head(top)
+        return companies.reindex(columns=self._result_columns)
+
+    def _refresh_prices_loop(self):
+
+        while not self._stop_event.wait(self._price_refresh_interval_seconds):
+            try:
+                self.refresh_prices()
+            except Exception as e:
+                print(f"failed to refresh prices: {e}")
+
+    def _refresh_labels_loop(self):
+
+        # 起動直後に全社分を取得し、以降は新しい会社の分と1日毎の取り直し (全社分は時間が掛かるので株価とは別に)
+        while True:
+            try:
+                if self._labels_updated is None or time.monotonic() - self._labels_updated >= self._label_refresh_interval_seconds:
+                    self.refresh_labels()
+                else:
+                    self.fetch_missing_labels()
+            except Exception as e:
+                print(f"failed to refresh labels: {e}")
+            if self._stop_event.wait(self._price_refresh_interval_seconds):
+                return
+
+    def start(self):
+
+        # 起動時に株価を取得しておき、ラベルは裏で取得する (取得するまでは保留として返す)
+        self.refresh_prices()
+
+        self._refresh_threads = [
+            threading.Thread(target=self._refresh_prices_loop, daemon=True),
+            threading.Thread(target=self._refresh_labels_loop, daemon=True),
+        ]
+        for thread in self._refresh_threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+    @staticmethod
+    def _parse_query_params(query_string: str) -> dict:
+
+        # ?top=10&sort=per&ascending=1&max_per=8&excluded_industries=銀行,証券&enable=average_salary
+        params = urllib.parse.parse_qs(query_string)
+        defaults = ValueScreen.get_default_thresholds()
+        thresholds = {}
+        for key, values in params.items():
+            if not key in defaults:
+                continue
+            if isinstance(defaults[key], list):
+                thresholds[key] = [value for value in values[-1].split(",") if len(value) > 0]
+            else:
+                thresholds[key] = float(values[-1])
+
+        enabled_stages = {}
+        for name in ",".join(params.get("enable", [])).split(","):
+            if len(name) > 0:
+                enabled_stages[name] = True
+        for name in ",".join(params.get("disable", [])).split(","):
+            if len(name) > 0:
+                enabled_stages[name] = False
+
+        options = {
+            "thresholds": thresholds,
+            "enabled_stages": enabled_stages,
+            "sort": params.get("sort", ["critical_ratio"])[-1],
+            "ascending": params["ascending"][-1] == "1" if "ascending" in params else None,
+            "top": int(params.get("top", ["20"])[-1]),
+        }
+        return options
+
+    def _create_handler(self):
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parsed_url = urllib.parse.urlparse(self.path)
+                if parsed_url.path == "/health":
+                    self._send_json(200, {"status": "ok"})
+                    return
+                if parsed_url.path != "/screen":
+                    self._send_json(404, {"error": "not found"})
+                    return
+
+                try:
+                    options = service._parse_query_params(parsed_url.query)
+                    start_time = time.perf_counter()
+                    companies = service.query(**options)
+                    elapsed_ms = (time.perf_counter() - start_time) * 1000
+                except (ValueError, KeyError) as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+
+                records = companies.astype(object).where(companies.notna(), None).to_dict(orient="records")
+                self._send_json(200, {"count": len(records), "elapsed_ms": elapsed_ms, "results": records})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8765):
+
+        # ローカルからの問い合わせのみ受け付ける
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        print(f"serving on http://{host}:{port}/screen")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,234 @@
+import os
+import csv
+import json
+import math
+import heapq
+import pandas as pd
+from typing import Iterable, Iterator
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ScreenResult:
+
+    # 絞り込みを通過した1社分の結果 (欠損値: 文字列は "", 数値は NaN)
+    _str_fields = ["edinet_code", "doc_id", "company_name", "ticker", "industry_name", "research_analysis", "pick_diag"]
+    _float_fields = ["score_ratio", "per", "critical_ratio", "stock_price"]
+
+    __slots__ = tuple(_str_fields) + tuple(_float_fields)
+
+    def __init__(self, **values):
+        for field in self._str_fields:
+            setattr(self, field, values.get(field, ""))
+        for field in self._float_fields:
+            setattr(self, field, values.get(field, math.nan))
+
+    @classmethod
+    def get_fields(cls) -> list[str]:
+        return list(cls.__slots__)
+
+    @classmethod
+    def get_str_fields(cls) -> list[str]:
+        return list(cls._str_fields)
+
+    @classmethod
+    def get_float_fields(cls) -> list[str]:
+        return list(cls._float_fields)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> Iterator["ScreenResult"]:
+
+        # 無効にした段階の列 (みんかぶのラベル等) は欠損値
+        columns = [df[field] if field in df.columns else pd.Series("", index=df.index) for field in cls._str_fields]
+        columns += [df[field] if field in df.columns else pd.Series(math.nan, index=df.index) for field in cls._float_fields]
+        for values in zip(*columns):
+            record = cls.__new__(cls)
+            for field, value in zip(cls._str_fields, values):
+                setattr(record, field, value if isinstance(value, str) else "")
+            for field, value in zip(cls._float_fields, values[len(cls._str_fields) :]):
+                setattr(record, field, float(value))
+            yield record
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def get_sort_key(self, metric: str = "critical_ratio", ascending: bool = False) -> tuple:
+        # 同じ値は会社・書類の順 (分割実行しても同じ順位にする)
+        value = getattr(self, metric)
+        return (value if ascending else -value, self.edinet_code, self.doc_id)
+
+
+class ScreenResultWriter:
+
+    # 結果を1件ずつ書き出す (形式は拡張子から: .csv, .jsonl, .parquet)
+    _formats = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+    def __init__(self, path: str, file_format: str | None = None, batch_size: int = 1000):
+        self._path = path
+        self._file_format = file_format if file_format is not None else self._formats.get(os.path.splitext(path)[1])
+        if not self._file_format in self._formats.values():
+            raise ValueError(f"unknown result format: {path} ({file_format})")
+        if self._file_format == "parquet" and pyarrow is None:
+            raise ImportError("pyarrow is required for parquet output")
+
+        # 書き終わるまでは別名にして、途中の状態のファイルを読ませない
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._temp_path = path + ".part"
+        self._count = 0
+        self._batch: list[ScreenResult] = []
+        self._batch_size = batch_size
+        self._file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        if self._file_format == "parquet":
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(self._temp_path, self._get_parquet_schema())
+        else:
+            self._file = open(self._temp_path, "w", encoding="utf-8", newline="")
+            if self._file_format == "csv":
+                self._csv_writer = csv.writer(self._file)
+                self._csv_writer.writerow(ScreenResult.get_fields())
+
+    def __enter__(self) -> "ScreenResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @staticmethod
+    def _get_parquet_schema():
+        fields = [(field, pyarrow.string()) for field in ScreenResult.get_str_fields()]
+        fields += [(field, pyarrow.float64()) for field in ScreenResult.get_float_fields()]
+        return pyarrow.schema(fields)
+
+    @staticmethod
+    def _format_float(value: float) -> str:
+        # reprは読み戻すと同じ値になる最短の表記
+        return "" if math.isnan(value) else repr(value)
+
+    def get_count(self) -> int:
+        return self._count
+
+    def write(self, record: ScreenResult):
+
+        self._count += 1
+        if self._file_format == "csv":
+            row = [getattr(record, field) for field in ScreenResult.get_str_fields()]
+            row += [self._format_float(getattr(record, field)) for field in ScreenResult.get_float_fields()]
+            self._csv_writer.writerow(row)
+        elif self._file_format == "jsonl":
+            values = {field: (None if isinstance(value, float) and math.isnan(value) else value) for field, value in record.to_dict().items()}
+            self._file.write(json.dumps(values, ensure_ascii=False) + "\n")
+        else:
+            # parquetは行グループ単位でまとめて書く
+            self._batch.append(record)
+            if len(self._batch) >= self._batch_size:
+                self._flush_batch()
+
+    def write_all(self, records: Iterable[ScreenResult]):
+        for record in records:
+            self.write(record)
+
+    def _flush_batch(self):
+        if len(self._batch) == 0:
+            return
+        columns = {field: [getattr(record, field) for record in self._batch] for field in ScreenResult.get_fields()}
+        self._parquet_writer.write_table(pyarrow.Table.from_pydict(columns, schema=self._parquet_writer.schema))
+        self._batch = []
+
+    def flush(self):
+        if self._parquet_writer is not None:
+            self._flush_batch()
+        else:
+            self._file.flush()
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._flush_batch()
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+        else:
+            return
+        os.replace(self._temp_path, self._path)
+
+    def abort(self):
+        # 書きかけのファイルは残さない
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    @classmethod
+    def write_file(cls, path: str, records: Iterable[ScreenResult], file_format: str | None = None):
+        with cls(path, file_format) as writer:
+            writer.write_all(records)
+
+
+class _RankedEntry:
+
+    # ヒープの先頭を最も順位の低いものにする (新しい結果と比べて入れ替える)
+    __slots__ = ("key", "record")
+
+    def __init__(self, key: tuple, record: ScreenResult):
+        self.key = key
+        self.record = record
+
+    def __lt__(self, other: "_RankedEntry") -> bool:
+        return self.key > other.key
+
+
+class TopKRanking:
+
+    # 小さいほど割安な指標 (それ以外は大きい順)
+    _ascending_metrics = {"per"}
+
+    # 上位k件のみを保持 (全体の件数に関わらずメモリはk件分), ascending: 省略時は指標から決める
+    def __init__(self, k: int, metric: str = "critical_ratio", ascending: bool | None = None):
+        if k <= 0:
+            raise ValueError(f"invalid k: {k}")
+        if not metric in ScreenResult.get_float_fields():
+            raise ValueError(f"unknown metric: {metric}")
+        self._k = k
+        self._metric = metric
+        self._ascending = ascending if ascending is not None else self.get_default_ascending(metric)
+        self._heap: list[_RankedEntry] = []
+        self._count = 0
+
+    @classmethod
+    def get_default_ascending(cls, metric: str) -> bool:
+        return metric in cls._ascending_metrics
+
+    def push(self, record: ScreenResult) -> bool:
+
+        # 指標が欠損している結果は順位を付けない
+        self._count += 1
+        if math.isnan(getattr(record, self._metric)):
+            return False
+        entry = _RankedEntry(record.get_sort_key(self._metric, self._ascending), record)
+        if len(self._heap) < self._k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry.key < self._heap[0].key:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def get_count(self) -> int:
+        # これまでに渡された件数 (保持していないものも含む)
+        return self._count
+
+    def get_sorted(self) -> list[ScreenResult]:
+        return [entry.record for entry in sorted(self._heap, key=lambda entry: entry.key)]
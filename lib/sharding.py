@@ -0,0 +1,73 @@
+import os
+import glob
+import zlib
+import numpy as np
+import pandas as pd
+from .screenresult import ScreenResult
+
+
+class ShardSpec:
+
+    def __init__(self, index: int, count: int):
+        if count <= 0 or index < 0 or index >= count:
+            raise ValueError(f"invalid shard: {index}/{count}")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value: str) -> "ShardSpec":
+        # "2/8" -> 8分割の2番目 (0始まり)
+        index, count = value.split("/")
+        return cls(int(index), int(count))
+
+    @staticmethod
+    def get_shard_index(key: str, count: int) -> int:
+        # 組み込みのhash()は実行毎に変わるので、プロセス・ノード間で同じになるCRC32を使う
+        return zlib.crc32(key.encode("utf-8")) % count
+
+    def owns(self, key: str) -> bool:
+        return self.get_shard_index(key, self.count) == self.index
+
+    def get_name(self) -> str:
+        return f"shard-{self.index:03d}-of-{self.count:03d}"
+
+
+class ShardResults:
+
+    # シャード毎の結果ファイル (CSV, 浮動小数点は往復しても同じ値になる形式で読む)
+    _filename = "screen_results.csv"
+    _str_columns = ScreenResult.get_str_fields()
+    _float_columns = ScreenResult.get_float_fields()
+
+    @classmethod
+    def get_path(cls, shard_path: str) -> str:
+        return os.path.join(shard_path, cls._filename)
+
+    @classmethod
+    def read(cls, path: str) -> pd.DataFrame:
+        df = pd.read_csv(path, dtype={column: str for column in cls._str_columns}, keep_default_na=False, float_precision="round_trip")
+        for column in cls._float_columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+        return df
+
+    @classmethod
+    def merge(cls, download_path: str, shard_count: int | None = None) -> pd.DataFrame:
+
+        # 全シャードの結果が揃っていなければエラー (一部だけで順位を作らない)
+        paths = sorted(glob.glob(os.path.join(download_path, "shard-*-of-*", cls._filename)))
+        if shard_count is None:
+            counts = set(int(os.path.basename(os.path.dirname(path)).split("-of-")[-1]) for path in paths)
+            if len(counts) > 1:
+                raise ValueError("results from different shard counts: " + ", ".join(str(count) for count in sorted(counts)))
+            shard_count = counts.pop() if len(counts) == 1 else None
+        if shard_count is not None:
+            expected = [cls.get_path(os.path.join(download_path, ShardSpec(index, shard_count).get_name())) for index in range(shard_count)]
+            missing = [path for path in expected if not path in paths]
+            if len(missing) > 0:
+                raise FileNotFoundError("missing shard results: " + ", ".join(missing))
+            paths = expected
+
+        frames = [cls.read(path) for path in paths]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=cls._str_columns + cls._float_columns)
+        return pd.concat(frames, ignore_index=True)
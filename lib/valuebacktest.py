@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+from .fundamentalsscreener import FundamentalsScreener
+from .pricehistorystore import PriceHistoryStore
+from .valuescreen import ValueScreen
+from .yahoofinancewrapper import YahooFinanceWrapper
+
+
+class ValueBacktest:
+
+    # 過去時点のみんかぶのラベルは取得できないので、財務と株価の条件のみで評価
+    _disabled_stages = {"industry_name": False, "research_analysis": False, "pick_diag": False}
+
+    def __init__(
+        self,
+        fundamentals: pd.DataFrame,
+        price_store: PriceHistoryStore,
+        thresholds: dict | None = None,
+        enabled_stages: dict[str, bool] | None = None,
+        max_filing_age_days: int = 400,
+        lookback_days: int = 14,
+    ):
+        # fundamentals: FundamentalsScreener.get_frame() (複数年分の書類を含む)
+        self._fundamentals = fundamentals
+        self._price_store = price_store
+        self._thresholds = thresholds
+        self._enabled_stages = dict(self._disabled_stages)
+        if enabled_stages is not None:
+            self._enabled_stages.update(enabled_stages)
+        self._max_filing_age_days = max_filing_age_days
+        self._lookback_days = lookback_days
+        self._panel: pd.DataFrame | None = None
+        self._selected: pd.DataFrame | None = None
+
+    def _get_filings(self) -> pd.DataFrame:
+
+        filings = self._fundamentals.copy()
+        filings["filing_date"] = pd.to_datetime(filings["filing_date"], errors="coerce")
+        tickers = {code: YahooFinanceWrapper.security_code_to_ticker(code) for code in filings["security_code"].unique()}
+        filings["ticker"] = filings["security_code"].map(tickers)
+        filings = filings[filings["filing_date"].notna() & (filings["ticker"] != "")]
+        filings["company_code"] = filings["ticker"].str.split(".").str[0]
+        return filings.sort_values("filing_date")
+
+    def _load_prices(self, ticker_ids: dict[str, int], start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+
+        # 必要な列だけを全銘柄分まとめて読み込み、銘柄は整数IDにして以降は全てメモリ上で結合する
+        start_date_str = (start - pd.Timedelta(days=self._lookback_days)).strftime("%Y-%m-%d")
+        history = self._price_store.get_history(list(ticker_ids.keys()), start_date_str, end.strftime("%Y-%m-%d"), columns=["close", "adj_close"])
+        prices = pd.DataFrame(
+            {
+                "ticker_id": history["ticker"].map(ticker_ids).astype(np.int32),
+                "date": history["date"],
+                "close": history["close"],
+                "adj_close": history["adj_close"].fillna(history["close"]),
+            }
+        )
+        prices = prices.dropna(subset=["close"])
+        return prices.sort_values("date", kind="stable")
+
+    def _as_of(self, left: pd.DataFrame, on: str, prices: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+        # 各日付以前で直近の価格 (休場日は前営業日, lookback_daysより古ければNaN)
+        left = left.sort_values(on)
+        right = prices[["ticker_id", "date"] + columns].rename(columns={"date": on})
+        # 日時の精度を揃える (株価は保存時の精度のまま)
+        right[on] = right[on].astype(left[on].dtype)
+        return pd.merge_asof(
+            left,
+            right,
+            on=on,
+            by="ticker_id",
+            direction="backward",
+            tolerance=pd.Timedelta(days=self._lookback_days),
+        )
+
+    @staticmethod
+    def _get_schedule(start_date_str: str, end_date_str: str, frequency: str, horizon_days: int | None) -> tuple[pd.DatetimeIndex, pd.Timedelta]:
+
+        rebalance_dates = pd.date_range(start_date_str, end_date_str, freq=frequency)
+        if len(rebalance_dates) == 0:
+            raise ValueError(f"no rebalance dates between {start_date_str} and {end_date_str} ({frequency})")
+        if horizon_days is None:
+            steps = np.diff(rebalance_dates.to_numpy()).astype("timedelta64[D]").astype(int)
+            horizon_days = int(np.median(steps)) if len(steps) > 0 else 30
+        return rebalance_dates, pd.Timedelta(days=horizon_days)
+
+    def get_price_range(self, start_date_str: str, end_date_str: str, frequency: str = "MS", horizon_days: int | None = None) -> tuple[str, str]:
+
+        # run()が参照する株価の期間 (最初のリバランス日より前の営業日から、最後の保有期間の終わりまで)
+        rebalance_dates, horizon = self._get_schedule(start_date_str, end_date_str, frequency, horizon_days)
+        start = rebalance_dates[0] - pd.Timedelta(days=self._lookback_days)
+        end = rebalance_dates[-1] + horizon
+        return (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+    def run(self, start_date_str: str, end_date_str: str, frequency: str = "MS", horizon_days: int | None = None, top: int | None = None) -> pd.DataFrame:
+
+        # frequency: リバランス間隔 (pandasの期間指定, 既定は月初), horizon_days: 保有日数 (既定は次のリバランスまで)
+        rebalance_dates, horizon = self._get_schedule(start_date_str, end_date_str, frequency, horizon_days)
+
+        filings = self._get_filings()
+        ticker_ids = {ticker: ticker_id for ticker_id, ticker in enumerate(sorted(filings["ticker"].unique()))}
+        prices = self._load_prices(ticker_ids, rebalance_dates[0], rebalance_dates[-1] + horizon)
+
+        # リバランス日 x 会社 に、その時点で提出済みの最新の書類を結合
+        companies = filings[["edinet_code", "ticker"]].drop_duplicates("edinet_code")
+        panel = companies.merge(pd.DataFrame({"rebalance_date": rebalance_dates}), how="cross")
+        filing_columns = [column for column in filings.columns if column != "ticker"]
+        panel = pd.merge_asof(
+            panel.sort_values("rebalance_date"),
+            filings[filing_columns].sort_values("filing_date"),
+            left_on="rebalance_date",
+            right_on="filing_date",
+            by="edinet_code",
+            direction="backward",
+            tolerance=pd.Timedelta(days=self._max_filing_age_days),
+        )
+        panel = panel[panel["filing_date"].notna()].copy()
+        panel["ticker_id"] = panel["ticker"].map(ticker_ids).astype(np.int32)
+
+        # 買い付け時点と保有期間後の株価
+        panel = self._as_of(panel, "rebalance_date", prices, ["close", "adj_close"]).rename(columns={"adj_close": "entry_adj_close"})
+        panel["exit_date"] = panel["rebalance_date"] + horizon
+        panel = self._as_of(panel, "exit_date", prices, ["adj_close"]).rename(columns={"adj_close": "exit_adj_close"})
+        panel = panel.reset_index(drop=True)
+        panel["forward_return"] = panel["exit_adj_close"] / panel["entry_adj_close"] - 1.0
+
+        # 全時点をまとめて同じ条件で絞り込む (条件は行毎に独立なので一括で評価できる)
+        panel = FundamentalsScreener.apply_prices(panel, panel["close"])
+        # 株価は結合済みなので取得処理は差し替える (Yahooのラッパーは使わない)
+        value_screen = ValueScreen(None, None, self._thresholds, self._enabled_stages)
+        pipeline = value_screen.create_pipeline({"yahoo": lambda df: df, "minkabu": lambda df: df})
+        selected = pipeline.run(panel)
+
+        # 時点毎に割安度の高い順で上位のみ
+        if top is not None:
+            order = selected.groupby("rebalance_date")["critical_ratio"].rank(ascending=False, method="first")
+            selected = selected[order <= top]
+
+        self._panel = panel
+        self._selected = selected
+        return selected
+
+    def get_period_returns(self) -> pd.DataFrame:
+
+        if self._panel is None:
+            raise ValueError("run() must be called before reading results")
+
+        # 時点毎の等金額平均リターン (比較対象は株価のある全社)
+        universe = self._panel[self._panel["forward_return"].notna()].groupby("rebalance_date")["forward_return"]
+        selected = self._selected[self._selected["forward_return"].notna()].groupby("rebalance_date")["forward_return"]
+        periods = pd.DataFrame(
+            {
+                "selected_count": selected.size(),
+                "selected_return": selected.mean(),
+                "universe_count": universe.size(),
+                "universe_return": universe.mean(),
+            }
+        )
+        periods = periods.reindex(sorted(set(self._panel["rebalance_date"])))
+        periods["selected_count"] = periods["selected_count"].fillna(0).astype(int)
+        periods["universe_count"] = periods["universe_count"].fillna(0).astype(int)
+        periods["excess_return"] = periods["selected_return"] - periods["universe_return"]
+        return periods
+
+    def get_summary(self) -> dict:
+
+        # 各期間のリターンを順に複利で (保有期間がリバランス間隔と同じ場合の累積)
+        periods = self.get_period_returns()
+        selected_returns = periods["selected_return"].fillna(0.0)
+        universe_returns = periods["universe_return"].fillna(0.0)
+        years = (periods.index[-1] - periods.index[0]).days / 365.25 if len(periods) > 1 else 0.0
+        cumulative = float((1.0 + selected_returns).prod() - 1.0)
+        universe_cumulative = float((1.0 + universe_returns).prod() - 1.0)
+        return {
+            "periods": len(periods),
+            "average_selected_count": float(periods["selected_count"].mean()),
+            "mean_period_return": float(periods["selected_return"].mean()),
+            "mean_excess_return": float(periods["excess_return"].mean()),
+            "hit_rate": float((periods["excess_return"] > 0).sum() / max(periods["excess_return"].notna().sum(), 1)),
+            "cumulative_return": cumulative,
+            "universe_cumulative_return": universe_cumulative,
+            "annualized_return": (1.0 + cumulative) ** (1.0 / years) - 1.0 if years > 0 and cumulative > -1.0 else float("nan"),
+        }
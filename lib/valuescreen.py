@@ -0,0 +1,156 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from typing import Callable
+from .fundamentalsscreener import FundamentalsScreener
+from .metrics import Metrics
+from .minkabuwrapper import MinkabuWrapper
+from .screeningpipeline import ScreeningPipeline, ScreeningSource, ScreeningStage
+from .yahoofinancewrapper import YahooFinanceJPWrapper, YahooFinanceWrapper
+
+
+class ValueScreen:
+
+    _default_thresholds = {
+        "min_score_per_stock": 1.0,
+        "min_earnings_loss_per_stock": 1.0,
+        "min_average_salary": 100 * 10000,
+        "min_employee_earning_power": 1.5,
+        "min_average_board_member_reward": 1500 * 10000,
+        "max_company_code_length": 4,
+        "min_score_ratio": 0.1,
+        "max_per": 10.0,
+        "excluded_industries": ["建設", "銀行", "不動産", "証券"],
+        "excluded_research_analysis": ["割高"],
+        "excluded_pick_diag": ["売り"],
+    }
+
+    # 既定では無効な条件
+    _default_disabled_stages = {"average_salary", "employee_earning_power", "average_board_member_reward"}
+
+    def __init__(
+        self,
+        yahoo_finance: YahooFinanceWrapper,
+        yahoo_finance_jp: YahooFinanceJPWrapper,
+        thresholds: dict | None = None,
+        enabled_stages: dict[str, bool] | None = None,
+    ):
+        self._yahoo_finance = yahoo_finance
+        self._yahoo_finance_jp = yahoo_finance_jp
+        self._thresholds = dict(self._default_thresholds)
+        if thresholds is not None:
+            self._thresholds.update(thresholds)
+        self._enabled_stages = enabled_stages if enabled_stages is not None else {}
+
+    @classmethod
+    def get_default_thresholds(cls) -> dict:
+        return dict(cls._default_thresholds)
+
+    def fetch_prices(self, df: pd.DataFrame, resolved_tickers: dict[str, str] | None = None) -> pd.DataFrame:
+
+        # resolved_tickers: 会社名 -> 検索ページで見つけたティッカー ("" は見つからなかった), 渡すと検索結果を追記して次回は検索しない
+        df = df.copy()
+        df["ticker"] = df["security_code"].map(YahooFinanceWrapper.security_code_to_ticker)
+        unknown = df["ticker"] == ""
+        if resolved_tickers is not None:
+            df.loc[unknown, "ticker"] = df.loc[unknown, "company_name"].map(resolved_tickers).fillna("")
+
+        # 証券コードが分かる銘柄はまとめて取得
+        known_tickers = sorted(set(ticker for ticker in df["ticker"] if len(ticker) > 0))
+        latest_prices = self._yahoo_finance.get_latest_prices(known_tickers)
+        stock_prices = df["ticker"].map(latest_prices).astype(np.float64)
+
+        # 証券コードが無い場合のみ検索ページから
+        for index in df.index[df["ticker"] == ""]:
+            company_name = df.at[index, "company_name"]
+            if resolved_tickers is not None and company_name in resolved_tickers:
+                continue
+            stock_price, aggregate_market_value, ticker = self._yahoo_finance_jp.get_company_info(company_name)
+            if resolved_tickers is not None:
+                resolved_tickers[company_name] = ticker if stock_price >= 0 else ""
+            if stock_price >= 0:
+                stock_prices[index] = stock_price
+                df.at[index, "ticker"] = ticker
+
+        df["company_code"] = df["ticker"].str.split(".").str[0]
+        return FundamentalsScreener.apply_prices(df, stock_prices)
+
+    async def _fetch_minkabu_pages(self, company_codes: list[str]) -> list[MinkabuWrapper | BaseException]:
+        # 1社の失敗で全体を止めない (失敗した会社は例外が返る)
+        return await asyncio.gather(*[MinkabuWrapper.create_async(company_code) for company_code in company_codes], return_exceptions=True)
+
+    def fetch_minkabu(self, df: pd.DataFrame) -> pd.DataFrame:
+
+        # みんかぶのページは並行して取得 (ホスト毎のレート制限内)
+        results = asyncio.run(self._fetch_minkabu_pages(df["company_code"].tolist()))
+
+        # 取得できなかった会社 (接続エラー・エラーページ・解析失敗) はラベルで判定できないので除く
+        failed = [isinstance(result, BaseException) for result in results]
+        for company_code, result in zip(df["company_code"], results):
+            if isinstance(result, BaseException):
+                print(f"couldn't fetch minkabu: {company_code}, {result}")
+        if any(failed):
+            Metrics.get_shared().increment("minkabu.fetch_failures", sum(failed))
+        df = df[[not is_failed for is_failed in failed]].copy()
+        minkabus = [result for result in results if not isinstance(result, BaseException)]
+        df["industry_name"] = [minkabu.get_industry_name() for minkabu in minkabus]
+        df["research_analysis"] = [minkabu.get_research_analysis() for minkabu in minkabus]
+        df["pick_diag"] = [minkabu.get_pick_diag() for minkabu in minkabus]
+        return df
+
+    @staticmethod
+    def _contains_any(values: pd.Series, keywords: list[str]) -> pd.Series:
+        mask = pd.Series(False, index=values.index)
+        for keyword in keywords:
+            mask |= values.str.contains(keyword, regex=False)
+        return mask
+
+    def create_pipeline(self, fetchers: dict[str, Callable[[pd.DataFrame], pd.DataFrame]] | None = None) -> ScreeningPipeline:
+
+        # fetchers: ソース名 -> 取得処理 (キャッシュ済みのデータを使う場合などに差し替え)
+        fetchers = fetchers if fetchers is not None else {}
+        t = self._thresholds
+        sources = [
+            ScreeningSource("local", 0),
+            ScreeningSource(
+                "yahoo",
+                1,
+                fetchers.get("yahoo", self.fetch_prices),
+                inputs=["security_code", "company_name", "score_per_stock", "earnings_loss_per_stock"],
+                outputs=["ticker", "company_code", "stock_price", "score_ratio", "per", "critical_ratio"],
+            ),
+            ScreeningSource(
+                "minkabu",
+                2,
+                fetchers.get("minkabu", self.fetch_minkabu),
+                inputs=["company_code"],
+                outputs=["industry_name", "research_analysis", "pick_diag"],
+            ),
+        ]
+
+        def stage(name: str, source: str, column: str, predicate: Callable[[pd.Series], pd.Series]) -> ScreeningStage:
+            # 1列だけを見る条件 (参照する列を宣言しておく)
+            return ScreeningStage(name, source, lambda df: predicate(df[column]), inputs=[column])
+
+        stages = [
+            stage("company_name", "local", "company_name", lambda values: values != ""),
+            stage("score_per_stock", "local", "score_per_stock", lambda values: values >= t["min_score_per_stock"]),
+            stage("earnings_loss_per_stock", "local", "earnings_loss_per_stock", lambda values: values >= t["min_earnings_loss_per_stock"]),
+            stage("average_salary", "local", "average_salary", lambda values: values >= t["min_average_salary"]),
+            stage("employee_earning_power", "local", "employee_earning_power", lambda values: values >= t["min_employee_earning_power"]),
+            stage(
+                "average_board_member_reward", "local", "average_board_member_reward", lambda values: values >= t["min_average_board_member_reward"]
+            ),
+            stage("stock_price", "yahoo", "stock_price", lambda values: values > 0),
+            stage("company_code", "yahoo", "company_code", lambda values: values.str.len() <= t["max_company_code_length"]),
+            stage("score_ratio", "yahoo", "score_ratio", lambda values: values >= t["min_score_ratio"]),
+            stage("per", "yahoo", "per", lambda values: values <= t["max_per"]),
+            stage("industry_name", "minkabu", "industry_name", lambda values: ~self._contains_any(values, t["excluded_industries"])),
+            stage("research_analysis", "minkabu", "research_analysis", lambda values: ~self._contains_any(values, t["excluded_research_analysis"])),
+            stage("pick_diag", "minkabu", "pick_diag", lambda values: ~self._contains_any(values, t["excluded_pick_diag"])),
+        ]
+
+        for stage in stages:
+            stage.enabled = self._enabled_stages.get(stage.name, not stage.name in self._default_disabled_stages)
+
+        return ScreeningPipeline(sources, stages)
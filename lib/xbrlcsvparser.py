@@ -0,0 +1,41 @@
+import pandas as pd
+from typing import IO
+
+
+class XBRLCsvParser:
+
+    # EDINETのCSV (type=5) で値が無いことを表す記号
+    _nil_value = "－"
+
+    def parse_file(self, csv_path: str | IO[bytes], xbrl_targets: list[list[str]]) -> dict:
+
+        # タブ区切り・UTF-16 / 要素ID, コンテキストID, 値 の列だけ読む
+        df = pd.read_csv(
+            csv_path,
+            sep="\t",
+            encoding="utf-16",
+            usecols=[0, 2, 8],
+            header=0,
+            dtype=str,
+            keep_default_na=False,
+        )
+        df.columns = ["element", "context", "value"]
+
+        # 対象の要素のみに絞ってから項目毎に抽出
+        keys = set(target_items[1] for target_items in xbrl_targets)
+        df = df[df["element"].isin(keys) & (df["value"] != "") & (df["value"] != self._nil_value)]
+
+        result: dict[str, str | list] = {}
+        for name, key, context_filter, kind in xbrl_targets:
+            is_single = kind == "single"
+            rows = df[df["element"] == key]
+            if len(context_filter) > 0:
+                rows = rows[rows["context"].str.contains(context_filter, regex=False)]
+            items = rows["value"].tolist()
+
+            if len(items) == 0:
+                result[name] = "" if is_single else []
+            else:
+                result[name] = items[0] if is_single else items
+
+        return result
@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .xbrlparserwrapper import XBRLParserWrapper
+from .xbrlresultcache import XBRLResultCache
+from .fundamentalsrecord import FundamentalsRecord
+from .metrics import Metrics
+
+
+def _parse_xbrl_file(xbrl_path: str, engine: str) -> FundamentalsRecord | None:
+
+    # ワーカーからはパーサーオブジェクトではなく数値変換済みのレコードのみ返す
+    try:
+        if xbrl_path.endswith(".csv"):
+            engine = "csv"
+        return XBRLParserWrapper(xbrl_path, engine=engine).get_record()
+    except Exception as e:
+        print("couldn't parse xbrl: " + xbrl_path + ", " + str(e))
+        return None
+
+
+class XBRLParallelParser:
+
+    def __init__(self, max_workers: int | None = None, engine: str = "stream", chunksize: int = 16, cache: XBRLResultCache | None = None):
+        self._max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self._engine = engine
+        self._chunksize = chunksize
+        self._cache = cache
+
+    def parse_files(self, xbrl_paths: list[str]) -> dict[str, FundamentalsRecord]:
+
+        # キャッシュ済みのものは解析しない
+        cached_results = self._cache.get_many(xbrl_paths) if self._cache is not None else {}
+        target_paths = [xbrl_path for xbrl_path in xbrl_paths if not xbrl_path in cached_results]
+
+        # 1プロセスなら並列化しない
+        metrics = Metrics.get_shared()
+        with metrics.timer("xbrl.parse_files"):
+            if self._max_workers <= 1 or len(target_paths) <= 1:
+                results = [_parse_xbrl_file(xbrl_path, self._engine) for xbrl_path in target_paths]
+            else:
+                with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+                    engines = [self._engine] * len(target_paths)
+                    results = list(executor.map(_parse_xbrl_file, target_paths, engines, chunksize=self._chunksize))
+
+        # 失敗したファイルも記録して、変更されるまで解析し直さない
+        parsed_results = dict(zip(target_paths, results))
+        failure_count = sum(result is None for result in results)
+        metrics.increment("xbrl.parsed", len(parsed_results) - failure_count)
+        metrics.increment("xbrl.parse_failures", failure_count)
+        if self._cache is not None:
+            self._cache.put_many(parsed_results)
+
+        # 入力順を保持 (失敗したものは除く)
+        all_results = {}
+        for xbrl_path in xbrl_paths:
+            result = cached_results[xbrl_path] if xbrl_path in cached_results else parsed_results.get(xbrl_path)
+            if result is not None:
+                all_results[xbrl_path] = result
+        return all_results
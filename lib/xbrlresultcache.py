@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from .filingpack import FilingPack
+from .fundamentalsrecord import FundamentalsRecord
+from .metrics import Metrics
+
+
+class XBRLResultCache:
+
+    # 解析処理・派生値の計算方法を変えたら上げる (保存済みの結果は全て破棄される)
+    CACHE_VERSION = 2
+
+    def _create_tables(self):
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (xbrl_path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, result TEXT NOT NULL)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+            # 解析対象・処理が変わったら全て破棄
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'targets_hash'").fetchone()
+            if row is None or row[0] != self._targets_hash:
+                self._connection.execute("DELETE FROM results")
+                self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('targets_hash', ?)", (self._targets_hash,))
+
+    def __init__(self, cache_dir: str, xbrl_targets: list[list[str]], engine: str = "stream", filename: str = "xbrl_result_cache.sqlite3"):
+        self._path = os.path.join(cache_dir, filename)
+        # 解析対象・レコードの項目・解析方法・処理の版が変わったら無効
+        signature = [self.CACHE_VERSION, engine, xbrl_targets, FundamentalsRecord.get_fields()]
+        self._targets_hash = hashlib.sha256(json.dumps(signature, ensure_ascii=False).encode("utf-8")).hexdigest()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._create_tables()
+        self._hits = 0
+        self._misses = 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_stats(self) -> tuple[int, int]:
+        # (hits, misses)
+        return (self._hits, self._misses)
+
+    def get_many(self, xbrl_paths: list[str]) -> dict[str, FundamentalsRecord | None]:
+
+        # 解析に失敗したファイルはNone (ファイルが変わるまで解析し直さない)
+        with self._lock:
+            rows = self._connection.execute("SELECT xbrl_path, mtime_ns, size, result FROM results").fetchall()
+        cached = {xbrl_path: (mtime_ns, size, result) for xbrl_path, mtime_ns, size, result in rows}
+
+        # パス + 更新時刻 + サイズ (アーカイブ内はオフセット + 長さ) が一致するものだけ採用
+        results = {}
+        for xbrl_path in xbrl_paths:
+            entry = cached.get(xbrl_path)
+            if entry is not None:
+                mtime_ns, size = FilingPack.stat(xbrl_path)
+                if entry[0] == mtime_ns and entry[1] == size:
+                    values = json.loads(entry[2])
+                    results[xbrl_path] = FundamentalsRecord.from_tuple(values) if values is not None else None
+        self._hits += len(results)
+        self._misses += len(xbrl_paths) - len(results)
+        Metrics.get_shared().increment("xbrl.cache_hits", len(results))
+        Metrics.get_shared().increment("xbrl.cache_misses", len(xbrl_paths) - len(results))
+        return results
+
+    def put_many(self, results: dict[str, FundamentalsRecord | None]):
+
+        rows = []
+        for xbrl_path, result in results.items():
+            mtime_ns, size = FilingPack.stat(xbrl_path)
+            rows.append((xbrl_path, mtime_ns, size, json.dumps(result.to_tuple() if result is not None else None, ensure_ascii=False)))
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO results (xbrl_path, mtime_ns, size, result) VALUES (?, ?, ?, ?)", rows)
@@ -0,0 +1,79 @@
+import xml.etree.ElementTree as ET
+from typing import IO
+
+
+class XBRLStreamParser:
+
+    def _get_string(self, element: ET.Element) -> str | None:
+
+        # BeautifulSoupのTag.stringと同じ規則
+        # (子要素なし -> テキスト, 子要素1つのみ -> 子のstring, それ以外 -> None)
+        children = list(element)
+        if len(children) == 0:
+            return element.text if element.text else None
+        if len(children) == 1 and not element.text and not children[0].tail:
+            return self._get_string(children[0])
+        return None
+
+    def parse_file(self, xbrl_file: str | IO[bytes], xbrl_targets: list[list[str]]) -> dict:
+
+        # 要素名 -> [(name, context_filter, is_single), ...]
+        targets_by_key: dict[str, list[tuple[str, str, bool]]] = {}
+        for name, key, context_filter, kind in xbrl_targets:
+            targets_by_key.setdefault(key.lower(), []).append((name, context_filter, kind == "single"))
+
+        items_by_name: dict[str, list[str]] = {target_items[0]: [] for target_items in xbrl_targets}
+        prefixes: dict[str, str] = {}
+        root = None
+        depth = 0
+
+        for event, value in ET.iterparse(xbrl_file, events=("start-ns", "start", "end")):
+
+            if event == "start-ns":
+                prefix, uri = value
+                prefixes[uri] = prefix
+                continue
+
+            element: ET.Element = value
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+
+            # {uri}LocalName -> prefix:localname
+            tag = element.tag
+            if tag[0] == "{":
+                uri, local_name = tag[1:].split("}", 1)
+                prefix = prefixes.get(uri, "")
+                key = (prefix + ":" + local_name).lower() if len(prefix) > 0 else local_name.lower()
+            else:
+                key = tag.lower()
+
+            targets = targets_by_key.get(key)
+            if targets is not None:
+                context_ref = element.get("contextRef", "")
+                text = self._get_string(element)
+                if text is not None:
+                    for name, context_filter, is_single in targets:
+                        if context_filter in context_ref:
+                            items = items_by_name[name]
+                            if not is_single or len(items) == 0:
+                                items.append(text)
+
+            # ルート直下の要素を処理し終えたら解放
+            if depth == 1:
+                root.clear()
+
+        result: dict[str, str | list] = {}
+        for name, key, context_filter, kind in xbrl_targets:
+            items = items_by_name[name]
+            is_single = kind == "single"
+            if len(items) == 0:
+                result[name] = "" if is_single else []
+            else:
+                result[name] = items[0] if is_single else items
+
+        return result
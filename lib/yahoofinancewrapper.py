@@ -1,9 +1,11 @@
 from bs4 import BeautifulSoup
 import urllib.parse
-import requests
 import yfinance as yf
+import pandas as pd
 from datetime import datetime, timedelta
-import time
+from .httpclient import HttpClient
+from .pricehistorystore import PriceHistoryStore
+from .metrics import Metrics
 
 
 class YahooFinanceJPWrapper:
@@ -16,30 +18,29 @@ class YahooFinanceJPWrapper:
         path_segments = parsed_url.path.rstrip("/").split("/")
         return path_segments[-1] if path_segments else ""
 
-    def __init__(self):
+    def __init__(self, http_client: HttpClient | None = None, cache_ttl_seconds: float = 5 * 60, base_url: str = "https://finance.yahoo.co.jp"):
         self._company_atag_class = "_1WbkBLD0"
         self._stock_price_class = "_1fofaCjs _2aohzPlv _2eYW5OYe"
         self._aggregate_market_value_class = "_3rXWJKZF _1NrnBlaN"
         self._request_duration_seconds = 0.5
-        self._previous_request_date = datetime.now()
+        self._cache_ttl_seconds = cache_ttl_seconds
+        self._base_url = base_url.rstrip("/")
+        self._http_client = http_client if http_client is not None else HttpClient.get_shared()
 
-    def get_company_info(self, company_name: str) -> tuple[float, float, str]:
+        # request timing はホスト単位のトークンバケットで制御 (未設定のホストのみ)
+        self._http_client.set_default_rate_limit(urllib.parse.urlparse(self._base_url).hostname, 1.0 / self._request_duration_seconds)
 
-        # wait for request timing
-        target_datetime = self._previous_request_date + timedelta(seconds=self._request_duration_seconds)
-        while datetime.now() < target_datetime:
-            time.sleep(0.01)
-        self._previous_request_date = datetime.now()
+    def get_company_info(self, company_name: str) -> tuple[float, float, str]:
 
         # trim
         company_name = company_name.replace("株式会社", "")
 
         try:
             encoded_company_name = urllib.parse.quote(company_name)
-            url = f"https://finance.yahoo.co.jp/search/?query={encoded_company_name}"
+            url = f"{self._base_url}/search/?query={encoded_company_name}"
 
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, "html.parser")
+            html = self._http_client.get_text(url, cache_ttl_seconds=self._cache_ttl_seconds)
+            soup = BeautifulSoup(html, "html.parser")
 
             # find a tag
             a_tags = soup.find_all("a", class_=self._company_atag_class)
@@ -66,27 +67,116 @@ class YahooFinanceJPWrapper:
                 return (stock_price, aggregate_market_value, ticker)
         except Exception as e:
             print(f"エラーが発生しました: {e}")
+            Metrics.get_shared().increment("yahoo_jp.errors")
 
+        Metrics.get_shared().increment("yahoo_jp.no_result")
         return (-1.0, -1.0, "")
 
 
 class YahooFinanceWrapper:
-    def get_stock_price_on_date(ticker: str, date_str: str):
+    def __init__(self, price_store: PriceHistoryStore | None = None):
+        self._price_store = price_store
+
+    @staticmethod
+    def security_code_to_ticker(security_code: str) -> str:
+        # EDINETの証券コードは5桁(末尾0が普通株)
+        if len(security_code) == 0:
+            return ""
+        if len(security_code) == 5 and security_code.endswith("0"):
+            security_code = security_code[:4]
+        return security_code + ".T"
+
+    def _get_price_store(self) -> PriceHistoryStore:
+        if self._price_store is None:
+            raise ValueError("price_store is required for price history")
+        return self._price_store
+
+    def _download_history(self, tickers: list[str], start_date_str: str, end_date_str: str) -> pd.DataFrame:
+
+        # 複数銘柄を一度に取得 (endは含まないので翌日を指定)
+        end_exclusive = (datetime.strptime(end_date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        metrics = Metrics.get_shared()
+        metrics.increment("yahoo.history_tickers", len(tickers))
+        with metrics.timer("yahoo.download_history"):
+            data = yf.download(
+                tickers,
+                start=start_date_str,
+                end=end_exclusive,
+                group_by="ticker",
+                auto_adjust=False,
+                progress=False,
+                threads=True,
+            )
+
+        if data is None or len(data) == 0:
+            return pd.DataFrame(columns=["ticker", "date"])
+
+        if not isinstance(data.columns, pd.MultiIndex):
+            data = pd.concat({tickers[0]: data}, axis=1)
+
+        # 縦持ちに変換
+        frames = []
+        downloaded_tickers = set(data.columns.get_level_values(0))
+        for ticker in tickers:
+            if not ticker in downloaded_tickers:
+                continue
+            history = data[ticker].dropna(how="all")
+            history = history.rename(columns=lambda column: column.lower().replace(" ", "_"))
+            history["ticker"] = ticker
+            history["date"] = history.index.strftime("%Y-%m-%d")
+            frames.append(history.reset_index(drop=True))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=["ticker", "date"])
+        return pd.concat(frames, ignore_index=True)
+
+    def download_price_history(self, tickers: list[str], start_date_str: str, end_date_str: str):
+
+        # 保存済みの期間は取得しない
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        missing_ranges = self._get_price_store().get_missing_ranges(tickers, start_date_str, end_date_str)
+        for (missing_start, missing_end), missing_tickers in missing_ranges.items():
+            history = self._download_history(missing_tickers, missing_start, missing_end)
+            self._get_price_store().put_history(history)
+
+            # 当日分はまだ確定していないので取得済みにしない
+            # 取得に失敗した・行が無かった銘柄も取得済みにせず、次回に取り直す
+            covered_end = min(missing_end, (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"))
+            covered_tickers = sorted(set(history["ticker"]))
+            if missing_start <= covered_end and covered_end < today_str and len(covered_tickers) > 0:
+                self._get_price_store().add_coverage(covered_tickers, missing_start, covered_end)
+
+    def get_prices_on_dates(self, queries: pd.DataFrame, column: str = "close") -> pd.Series:
+
+        # queries: ticker, date の組をまとめて取得してローカルで引き当てる
+        if len(queries) == 0:
+            return pd.Series(dtype=float, index=queries.index)
+        lookback_days = 14
+        start = (datetime.strptime(queries["date"].min(), "%Y-%m-%d") - timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+        self.download_price_history(sorted(queries["ticker"].unique()), start, queries["date"].max())
+        return self._get_price_store().get_prices_as_of(queries, column, lookback_days)
+
+    def get_latest_prices(self, tickers: list[str]) -> dict[str, float]:
+
+        # 直近の終値 (取引時間中は当日の値)
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        queries = pd.DataFrame({"ticker": tickers, "date": [today_str] * len(tickers)})
+        prices = self.get_prices_on_dates(queries)
+        return {ticker: float(price) for ticker, price in zip(tickers, prices) if pd.notna(price)}
+
+    def get_stock_price_on_date(self, ticker: str, date_str: str):
         """
         指定したティッカーと日付に対応する株価を取得する関数
 
         :param ticker: 株のティッカーシンボル
         :param date: 株価を取得したい日付 (YYYY-MM-DD形式の文字列)
-        :return: 指定した日の株価データ (pandas DataFrame)
+        :return: 指定した日の株価データ (pandas Series), 休場日などでデータが無ければNone
         """
-        # 株価データを取得
-        stock = yf.Ticker(ticker)
-
-        # 指定した日付の前後1日分のデータを取得
-        data = stock.history(start="2024-02-25", end="2024-03-10")
+        # 指定した日付を含む期間を保存しておき、ローカルから取得
+        start = (datetime.strptime(date_str, "%Y-%m-%d") - timedelta(days=7)).strftime("%Y-%m-%d")
+        self.download_price_history([ticker], start, date_str)
+        data = self._get_price_store().get_history([ticker], date_str, date_str)
 
         # 特定の日の株価データを取得
-        if date_str in data.index:
-            return data.loc[date_str]
-        else:
+        if len(data) == 0:
             return None
+        return data.iloc[0]
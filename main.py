@@ -1,15 +1,39 @@
 import os
 import glob
-from datetime import datetime
+import argparse
+import multiprocessing
+from datetime import datetime, timedelta
 from lib import EdinetApiWrapper
 from lib import XBRLParserWrapper
+from lib import XBRLParallelParser
+from lib import XBRLResultCache
 from lib import YahooFinanceJPWrapper
-from lib import MinkabuWrapper
+from lib import YahooFinanceWrapper
+from lib import EdinetManifest
+from lib import FundamentalsScreener
+from lib import HttpClient
+from lib import HttpResponseCache
+from lib import PriceHistoryStore
+from lib import FilingPack
+from lib import ValueScreen
+from lib import ScreeningService
+from lib import Metrics
+from lib import ShardSpec
+from lib import ShardResults
+from lib import ValueBacktest
+from lib import ScreenResult
+from lib import ScreenResultWriter
+from lib import TopKRanking
 
 download_path = "downloads"
 
 
-def download():
+def get_shard_path(shard: ShardSpec | None) -> str:
+    # 分割実行時はシャード毎に保存先を分ける (索引・キャッシュ・結果も別)
+    return download_path if shard is None else os.path.join(download_path, shard.get_name())
+
+
+def download(file_format: str = "xbrl", use_pack: bool = False, shard: ShardSpec | None = None, rate_limit_scale: float = 1.0):
 
     edinet_api_key = ""
     if "EDINET_API_KEY" in os.environ:
@@ -19,121 +43,233 @@ def download():
         print("couldn't find EDINET_API_KEY")
         exit(-1)
 
-    if not os.path.exists(download_path):
-        os.mkdir(download_path)
+    path = get_shard_path(shard)
+    os.makedirs(path, exist_ok=True)
 
-    wrapper = EdinetApiWrapper(edinet_api_key, download_path)
+    HttpClient.get_shared().set_rate_limit_scale(rate_limit_scale)
+    wrapper = EdinetApiWrapper(edinet_api_key, path, file_format=file_format, use_pack=use_pack, shard=shard)
 
     start_date = datetime(2024, 7, 1)
     end_date = datetime(2024, 7, 31)
     wrapper.download_xbrl_files(start_date, end_date)
 
 
-def analyze():
+def load_fundamentals(max_workers: int | None = None, path: str | None = None) -> FundamentalsScreener:
+
+    path = path if path is not None else download_path
+
+    # ディレクトリ内のxbrlファイル一覧取得 (CSV形式で取得したものも含む)
+    xbrl_paths = sorted(glob.glob(f"{path}/*.xbrl") + glob.glob(f"{path}/*.csv"))
+
+    # 月毎のアーカイブに格納した書類
+    xbrl_paths += FilingPack(os.path.join(path, "packs")).list_sources()
+    xbrl_paths = FilingPack.unique_by_doc_id(xbrl_paths)
+
+    # 全ファイルを複数プロセスで並列に解析 (解析済みはキャッシュから)
+    engine = "stream"
+    cache = XBRLResultCache(path, XBRLParserWrapper.get_xbrl_targets(), engine)
+    parser = XBRLParallelParser(max_workers=max_workers, engine=engine, cache=cache)
+    parse_results = parser.parse_files(xbrl_paths)
+    hits, misses = cache.get_stats()
+    print(f"xbrl cache: {hits} hits, {misses} misses")
+
+    # 提出時に記録した証券コード (xbrlに無い場合の補完)
+    security_codes = EdinetManifest(path).get_security_codes()
+
+    return FundamentalsScreener(parse_results, security_codes)
+
+
+def print_companies(companies: list[ScreenResult]):
+    for company in companies:
+        print(
+            f"{company.company_name} {company.ticker}: {company.score_ratio} / {company.per} = {company.critical_ratio}, "
+            f"{company.stock_price}, {company.industry_name}, {company.research_analysis}, {company.pick_diag}"
+        )
+
+
+def analyze(
+    max_workers: int | None = None,
+    thresholds: dict | None = None,
+    enabled_stages: dict[str, bool] | None = None,
+    yahoo_finance: YahooFinanceWrapper | None = None,
+    yahoo_finance_jp: YahooFinanceJPWrapper | None = None,
+    shard: ShardSpec | None = None,
+    rate_limit_scale: float = 1.0,
+    output_format: str = "csv",
+    top: int = 30,
+    metric: str = "critical_ratio",
+    ascending: bool | None = None,
+    chunk_size: int = 500,
+):
+
+    path = get_shard_path(shard)
+    screener = load_fundamentals(max_workers, path)
+
+    # 取得済みのページは期限内なら再利用
+    http_cache = HttpResponseCache(path)
+    HttpClient.get_shared().set_cache(http_cache)
+    HttpClient.get_shared().set_rate_limit_scale(rate_limit_scale)
+
+    # 全社の財務データを表にして、安い条件から順に絞り込む
+    yfjpw = yahoo_finance_jp if yahoo_finance_jp is not None else YahooFinanceJPWrapper()
+    yfw = yahoo_finance if yahoo_finance is not None else YahooFinanceWrapper(PriceHistoryStore(path))
+    pipeline = ValueScreen(yfw, yfjpw, thresholds, enabled_stages).create_pipeline()
+
+    # 通過した会社は順に書き出し、上位のみ保持 (分割実行時はCSVを後でまとめる)
+    if shard is not None and output_format != "csv":
+        raise ValueError("shard results must be written as csv")
+    ranking = TopKRanking(top, metric, ascending)
+    results_path = os.path.join(path, "screen_results." + output_format)
+    top_path = os.path.join(path, "screen_top." + output_format)
+    with ScreenResultWriter(results_path) as writer:
+        for survivors in pipeline.run_chunks(screener.get_frame(), chunk_size):
+            for company in ScreenResult.from_frame(survivors):
+                writer.write(company)
+                ranking.push(company)
+
+            # 実行中でもその時点の上位を読めるように毎回置き換える
+            writer.flush()
+            ScreenResultWriter.write_file(top_path, ranking.get_sorted())
+
+    # 1社も無い場合も前回の上位を残さない
+    ScreenResultWriter.write_file(top_path, ranking.get_sorted())
+
+    print_companies(ranking.get_sorted())
+    print(f"{writer.get_count()} companies written to {results_path}")
+
+    pipeline.print_stats()
+    hits, misses = http_cache.get_stats()
+    print(f"http cache: {hits} hits, {misses} misses")
+
+
+def merge(shard_count: int | None = None, top: int = 30, metric: str = "critical_ratio", ascending: bool | None = None):
 
-    # ディレクトリ内のxbrlファイル一覧取得
-    pattern = f"{download_path}/*.xbrl"
-    xbrl_paths = sorted(glob.glob(pattern))
+    # 各シャードの結果をまとめて、1台で実行した場合と同じ形の結果ファイル (シャード順, 順位付けしない)・上位を出力
+    companies = ShardResults.merge(download_path, shard_count)
+    ranking = TopKRanking(top, metric, ascending)
+    with ScreenResultWriter(os.path.join(download_path, "screen_results.csv")) as writer:
+        for company in ScreenResult.from_frame(companies):
+            writer.write(company)
+            ranking.push(company)
+    ScreenResultWriter.write_file(os.path.join(download_path, "screen_top.csv"), ranking.get_sorted())
 
-    # 同一edinet codeでまとめ
-    companies = {}
-    for xbrl_path in xbrl_paths:
-        edinet_code = xbrl_path.split("_")[0]
-        if not edinet_code in companies:
-            companies[edinet_code] = []
-        companies[edinet_code].append(xbrl_path)
+    print_companies(ranking.get_sorted())
+    print(f"{writer.get_count()} companies merged")
+
+
+def _run_shard(shard: ShardSpec, with_download: bool, rate_limit_scale: float, max_workers: int | None, file_format: str = "xbrl", use_pack: bool = False):
+
+    if with_download:
+        download(file_format, use_pack, shard, rate_limit_scale)
+    analyze(max_workers=max_workers, shard=shard, rate_limit_scale=rate_limit_scale)
+    Metrics.get_shared().write(os.path.join(get_shard_path(shard), "metrics.json"))
+
+
+def run_local_shards(
+    shard_count: int,
+    with_download: bool = False,
+    top: int = 30,
+    metric: str = "critical_ratio",
+    ascending: bool | None = None,
+    file_format: str = "xbrl",
+    use_pack: bool = False,
+):
+
+    # 1台で複数シャードを並列に実行 (接続元が同じなのでホスト毎のレートはシャード数で割る)
+    rate_limit_scale = 1.0 / shard_count
+    max_workers = max(1, (os.cpu_count() or 1) // shard_count)
+    processes = []
+    for index in range(shard_count):
+        shard = ShardSpec(index, shard_count)
+        process = multiprocessing.Process(target=_run_shard, args=(shard, with_download, rate_limit_scale, max_workers, file_format, use_pack))
+        process.start()
+        processes.append(process)
+
+    failed = []
+    for index, process in enumerate(processes):
+        process.join()
+        if process.exitcode != 0:
+            failed.append(index)
+    if len(failed) > 0:
+        print("failed shards: " + ", ".join(str(index) for index in failed))
+        exit(-1)
+
+    merge(shard_count, top, metric, ascending)
+
+
+def backtest(start_date_str: str, end_date_str: str, frequency: str = "MS", top: int | None = 30, max_workers: int | None = None):
+
+    # 保存済みの書類を全て読み込み、各時点で提出済みの書類と株価だけで選んだ銘柄の成績を見る
+    screener = load_fundamentals(max_workers)
+    fundamentals = screener.get_frame()
+    price_store = PriceHistoryStore(download_path)
+    value_backtest = ValueBacktest(fundamentals, price_store)
+
+    # 株価は未取得の期間だけまとめて取得し、以降はローカルの履歴のみを使う
+    tickers = sorted(set(YahooFinanceWrapper.security_code_to_ticker(code) for code in fundamentals["security_code"]) - {""})
+    price_start_date_str, price_end_date_str = value_backtest.get_price_range(start_date_str, end_date_str, frequency)
+    YahooFinanceWrapper(price_store).download_price_history(tickers, price_start_date_str, price_end_date_str)
+
+    with Metrics.get_shared().timer("backtest.run"):
+        value_backtest.run(start_date_str, end_date_str, frequency, top=top)
+
+    print(value_backtest.get_period_returns().to_string())
+    for key, value in value_backtest.get_summary().items():
+        print(f"{key}: {value}")
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, max_workers: int | None = None):
+
+    # 財務データは起動時に一度だけ読み込み、株価・ラベルは常駐して定期的に更新
+    screener = load_fundamentals(max_workers)
+    HttpClient.get_shared().set_cache(HttpResponseCache(download_path))
 
-    # 同一単位で解析
     yfjpw = YahooFinanceJPWrapper()
-    for edinet_code, xbrl_paths in companies.items():
-        for xbrl_path in xbrl_paths:
-
-            wrapper = XBRLParserWrapper(xbrl_path)
-            company_name = wrapper.get_company_name()
-            if len(company_name) == 0:
-                # print("couldn't parse xbrl: " + edinet_code)
-                continue
-
-            score_per_stock = wrapper.get_score_per_stock()
-            if score_per_stock < 1:
-                continue
-
-            earnings_loss_per_stock = wrapper.get_earnings_loss_per_stock()
-            if earnings_loss_per_stock < 1:
-                continue
-
-            # average_salary = wrapper.get_average_salary()
-            # if average_salary < 100 * 10000:
-            #     continue
-
-            # number_of_issued_shares = wrapper.get_number_of_issued_shares()
-            # number_of_employees = wrapper.get_number_of_employees()
-            # earnings_per_employee = earnings_loss_per_stock * number_of_issued_shares / number_of_employees
-            # employee_earning_power = earnings_per_employee / average_salary
-            # if employee_earning_power < 1.5:
-            #     continue
-
-            # average_board_member_reward = wrapper.get_average_board_member_reward()
-            # average_board_member_reward_manen = int(average_board_member_reward / 10000)
-            # if average_board_member_reward_manen < 1500:
-            #     continue
-
-            # employee_average_age = wrapper.get_average_age()
-
-            # print(company_name + ": ", end="")
-            # print(str(earnings_loss_per_stock) + ", ", end="")
-            # print(str(score_per_stock) + ", ", end="")
-            # print(str(employee_earning_power) + ", ", end="")
-            # print(str(employee_average_age) + ", ", end="")
-            # print(str(average_board_member_reward_manen))
-            # continue
-
-            stock_price, aggregate_market_value, ticker = yfjpw.get_company_info(company_name)
-            if stock_price < 0:
-                continue
-
-            company_code = ticker.split(".")[0]
-            if len(company_code) > 4:
-                continue
-
-            minkabu = MinkabuWrapper(company_code)
-            industry_name = minkabu.get_industry_name()
-            if "建設" in industry_name:
-                continue
-            if "銀行" in industry_name:
-                continue
-            if "不動産" in industry_name:
-                continue
-            if "証券" in industry_name:
-                continue
-
-            research_analysis = minkabu.get_research_analysis()
-            if "割高" in research_analysis:
-                continue
-            pick_diag = minkabu.get_pick_diag()
-            if "売り" in pick_diag:
-                continue
-
-            score_ratio = score_per_stock / stock_price
-            if score_ratio < 0.1:
-                continue
-
-            per = stock_price / earnings_loss_per_stock
-            if per > 10:
-                continue
-
-            critical_ratio = score_ratio / per
-
-            print(company_name + " ", end="")
-            print(ticker + ": ", end="")
-            print(str(score_ratio) + " / ", end="")
-            print(str(per) + " = ", end="")
-            print(str(critical_ratio) + ", ", end="")
-            print(str(stock_price) + ", ", end="")
-            print(industry_name + ", ", end="")
-            print(research_analysis + ", ", end="")
-            print(pick_diag)
-
-
-# download()
-analyze()
+    yfw = YahooFinanceWrapper(PriceHistoryStore(download_path))
+    service = ScreeningService(screener.get_frame(), yfw, yfjpw)
+    service.start()
+    try:
+        service.serve(host, port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", default="analyze", choices=["download", "analyze", "merge", "shards", "serve", "backtest"])
+    parser.add_argument("--shard", type=ShardSpec.parse, default=None, help="run one shard, e.g. 2/8 (download, analyze)")
+    parser.add_argument("--shards", type=int, default=None, help="number of shards (merge, shards)")
+    parser.add_argument("--with-download", action="store_true", help="download before analyzing (shards)")
+    parser.add_argument("--start", default=None, help="first rebalance date, e.g. 2019-01-01 (backtest)")
+    parser.add_argument("--end", default=None, help="last rebalance date (backtest)")
+    parser.add_argument("--frequency", default="MS", help="rebalance interval as a pandas frequency, e.g. MS, QS (backtest)")
+    parser.add_argument("--top", type=int, default=30, help="companies to rank (analyze, merge, shards) or holdings per rebalance date (backtest)")
+    parser.add_argument("--metric", default="critical_ratio", choices=ScreenResult.get_float_fields(), help="ranking metric (analyze, merge, shards)")
+    parser.add_argument(
+        "--ascending", action=argparse.BooleanOptionalAction, default=None, help="rank lower values first (default: per ascending, others descending)"
+    )
+    parser.add_argument("--file-format", default="xbrl", choices=["xbrl", "csv"], help="filing format to download (download, shards)")
+    parser.add_argument("--pack", action="store_true", help="store downloaded filings in append-only packs (download, shards)")
+    parser.add_argument("--format", default="csv", choices=["csv", "jsonl", "parquet"], help="result file format (analyze)")
+    args = parser.parse_args()
+
+    # 終了時に処理時間・リクエスト数・絞り込みの内訳を表示して保存
+    Metrics.get_shared().report_at_exit(os.path.join(get_shard_path(args.shard), "metrics.json"))
+
+    if args.command == "download":
+        download(args.file_format, args.pack, args.shard)
+    elif args.command == "analyze":
+        analyze(shard=args.shard, output_format=args.format, top=args.top, metric=args.metric, ascending=args.ascending)
+    elif args.command == "merge":
+        merge(args.shards, args.top, args.metric, args.ascending)
+    elif args.command == "shards":
+        shard_count = args.shards if args.shards is not None else os.cpu_count() or 1
+        run_local_shards(shard_count, args.with_download, args.top, args.metric, args.ascending, args.file_format, args.pack)
+    elif args.command == "serve":
+        serve()
+    elif args.command == "backtest":
+        end_date_str = args.end if args.end is not None else datetime.now().strftime("%Y-%m-%d")
+        start_date_str = args.start if args.start is not None else (datetime.strptime(end_date_str, "%Y-%m-%d") - timedelta(days=5 * 365)).strftime("%Y-%m-%d")
+        backtest(start_date_str, end_date_str, args.frequency, top=args.top)
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from lib import ScreeningPipeline, ScreeningSource, ScreeningStage, ValueScreen
+
+
+def create_fundamentals() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "edinet_code": ["E00001", "E00002", "E00003"],
+            "doc_id": ["S1", "S2", "S3"],
+            "company_name": ["A社", "B社", "C社"],
+            "security_code": ["10010", "20020", "30030"],
+            "score_per_stock": [500.0, 500.0, 500.0],
+            "earnings_loss_per_stock": [200.0, 200.0, 200.0],
+        }
+    )
+
+
+def test_disabled_yahoo_stages_still_fetch_company_code():
+
+    calls = []
+
+    def fetch_prices(df: pd.DataFrame) -> pd.DataFrame:
+        calls.append("yahoo")
+        df = df.copy()
+        df["ticker"] = df["security_code"].str[:4] + ".T"
+        df["company_code"] = df["ticker"].str.split(".").str[0]
+        for column in ["stock_price", "score_ratio", "per", "critical_ratio"]:
+            df[column] = 1.0
+        return df
+
+    def fetch_minkabu(df: pd.DataFrame) -> pd.DataFrame:
+        calls.append("minkabu")
+        df = df.copy()
+        df["industry_name"] = df["company_code"].map({"1001": "建設業", "2002": "電気機器", "3003": "精密機器"})
+        df["research_analysis"] = "割安"
+        df["pick_diag"] = "買い"
+        return df
+
+    enabled_stages = {"stock_price": False, "company_code": False, "score_ratio": False, "per": False}
+    screen = ValueScreen(None, None, enabled_stages=enabled_stages)
+    pipeline = screen.create_pipeline({"yahoo": fetch_prices, "minkabu": fetch_minkabu})
+    survivors = pipeline.run(create_fundamentals())
+
+    assert calls == ["yahoo", "minkabu"]
+    assert survivors["company_name"].tolist() == ["B社", "C社"]
+
+
+def test_stage_input_fetches_its_provider_once():
+
+    calls = []
+
+    def fetch(df: pd.DataFrame) -> pd.DataFrame:
+        calls.append(len(df))
+        return df.assign(value=df["key"] * 10)
+
+    sources = [ScreeningSource("local", 0), ScreeningSource("remote", 1, fetch, inputs=["key"], outputs=["value"])]
+    stages = [
+        ScreeningStage("key", "local", lambda df: df["key"] > 1),
+        # ローカルの条件でもリモートの列を参照するなら先に取得する
+        ScreeningStage("value", "local", lambda df: df["value"] < 40, inputs=["value"]),
+        ScreeningStage("remote_value", "remote", lambda df: df["value"] > 20, inputs=["value"]),
+    ]
+    survivors = ScreeningPipeline(sources, stages).run(pd.DataFrame({"key": [1, 2, 3, 4]}))
+
+    assert calls == [3]
+    assert survivors["key"].tolist() == [3]
+
+
+def test_missing_provider_raises():
+
+    stages = [ScreeningStage("value", "local", lambda df: df["value"] > 0, inputs=["value"])]
+    pipeline = ScreeningPipeline([ScreeningSource("local", 0)], stages)
+    with pytest.raises(ValueError):
+        pipeline.run(pd.DataFrame({"key": [1]}))
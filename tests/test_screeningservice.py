@@ -0,0 +1,56 @@
+import pandas as pd
+from lib import MinkabuWrapper, ScreeningService
+
+
+class StubYahooFinance:
+    def get_latest_prices(self, tickers: list[str]) -> dict[str, float]:
+        # A社の方がPERが低い
+        return {ticker: 400.0 if ticker == "1001.T" else 1000.0 for ticker in tickers}
+
+
+def create_fundamentals() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "edinet_code": ["E00001", "E00002"],
+            "doc_id": ["S1", "S2"],
+            "company_name": ["A社", "B社"],
+            "security_code": ["10010", "20020"],
+            "score_per_stock": [500.0, 500.0],
+            "earnings_loss_per_stock": [200.0, 200.0],
+        }
+    )
+
+
+def test_query_uses_cached_labels_only(monkeypatch):
+
+    async def create_async(company_code: str):
+        raise AssertionError("query must not fetch minkabu")
+
+    monkeypatch.setattr(MinkabuWrapper, "create_async", create_async)
+    service = ScreeningService(create_fundamentals(), StubYahooFinance(), None)
+    service.refresh_prices()
+
+    companies = service.query()
+    assert companies["company_name"].tolist() == ["A社", "B社"]
+    assert companies["labels_pending"].tolist() == [True, True]
+
+    # 取得済みのラベルで絞り込み、無い会社は保留のまま
+    def fetch_label_frame(company_codes: list[str]) -> pd.DataFrame:
+        labels = {"industry_name": ["建設業"], "research_analysis": ["割安"], "pick_diag": ["買い"]}
+        return pd.DataFrame(labels, index=pd.Index(["1001"], name="company_code"))
+
+    monkeypatch.setattr(service, "_fetch_label_frame", fetch_label_frame)
+    service.fetch_missing_labels()
+    companies = service.query()
+    assert companies["company_name"].tolist() == ["B社"]
+    assert companies["labels_pending"].tolist() == [True]
+
+
+def test_query_sorts_per_ascending_by_default():
+
+    service = ScreeningService(create_fundamentals(), StubYahooFinance(), None)
+    service.refresh_prices()
+
+    assert service.query(sort="per")["company_name"].tolist() == ["A社", "B社"]
+    assert service.query(sort="per", ascending=False)["company_name"].tolist() == ["B社", "A社"]
+    assert ScreeningService._parse_query_params("sort=per")["ascending"] is None
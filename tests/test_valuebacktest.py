@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from lib import PriceHistoryStore, ValueBacktest
+
+
+def test_forward_returns_use_stored_prices(tmp_path):
+
+    store = PriceHistoryStore(str(tmp_path))
+    dates = pd.bdate_range("2023-12-15", "2024-03-15")
+    history = pd.DataFrame(
+        {
+            "ticker": ["1001.T"] * len(dates) + ["2002.T"] * len(dates),
+            "date": list(dates.strftime("%Y-%m-%d")) * 2,
+            "close": [100.0 + i for i in range(len(dates))] + [1000.0] * len(dates),
+        }
+    )
+    store.put_history(history)
+
+    fundamentals = pd.DataFrame(
+        {
+            "edinet_code": ["E00001", "E00002"],
+            "doc_id": ["S1", "S2"],
+            "company_name": ["A社", "B社"],
+            "security_code": ["10010", "20020"],
+            "filing_date": ["2023-06-30", "2023-06-30"],
+            "score_per_stock": [500.0, 500.0],
+            "earnings_loss_per_stock": [50.0, 50.0],
+        }
+    )
+    backtest = ValueBacktest(fundamentals, store)
+    selected = backtest.run("2024-01-01", "2024-02-01", horizon_days=30)
+
+    # B社は株価が高く割安度の条件で落ちる
+    assert selected["ticker"].unique().tolist() == ["1001.T"]
+    entry = history[history["date"] == "2024-01-01"]["close"].iloc[0]
+    exit = history[history["date"] == "2024-01-31"]["close"].iloc[0]
+    first = selected.sort_values("rebalance_date").iloc[0]
+    assert first["forward_return"] == pytest.approx(exit / entry - 1.0)
+
+    # 売却日 (2024-03-02) が休場日なら前営業日の価格
+    entry = history[history["date"] == "2024-02-01"]["close"].iloc[0]
+    exit = history[history["date"] == "2024-03-01"]["close"].iloc[0]
+    second = selected.sort_values("rebalance_date").iloc[1]
+    assert second["forward_return"] == pytest.approx(exit / entry - 1.0)
@@ -0,0 +1,43 @@
+import math
+import pytest
+from benchmarks.fixtureset import FixtureSet
+from lib import FundamentalsRecord, XBRLParserWrapper
+
+
+def assert_same_record(actual: FundamentalsRecord, expected: FundamentalsRecord):
+
+    # 両方とも空の結果で一致しないように
+    assert expected.company_name != "" and not math.isnan(expected.score_per_stock)
+
+    # 欠損値 (NaN) 同士は一致とみなす
+    for field, actual_value, expected_value in zip(FundamentalsRecord.get_fields(), actual.to_tuple(), expected.to_tuple()):
+        if isinstance(expected_value, float) and math.isnan(expected_value):
+            assert isinstance(actual_value, float) and math.isnan(actual_value), field
+        else:
+            assert actual_value == expected_value, field
+
+
+@pytest.fixture(scope="module")
+def filings(tmp_path_factory) -> list[tuple[str, str]]:
+
+    # 記録した書類から会社毎に値を変えたXBRL・CSVを作る
+    fixture_set = FixtureSet(companies=5)
+    directory = tmp_path_factory.mktemp("filings")
+    paths = []
+    for index in range(fixture_set.get_company_count()):
+        xbrl_path = directory / f"filing_{index}.xbrl"
+        csv_path = directory / f"filing_{index}.csv"
+        xbrl_path.write_bytes(fixture_set.get_xbrl(index))
+        csv_path.write_bytes(fixture_set.get_csv(index))
+        paths.append((str(xbrl_path), str(csv_path)))
+    return paths
+
+
+def test_stream_parser_matches_dom_parser(filings):
+    for xbrl_path, csv_path in filings:
+        assert_same_record(XBRLParserWrapper(xbrl_path, "stream").get_record(), XBRLParserWrapper(xbrl_path, "dom").get_record())
+
+
+def test_csv_parser_matches_dom_parser(filings):
+    for xbrl_path, csv_path in filings:
+        assert_same_record(XBRLParserWrapper(csv_path, "csv").get_record(), XBRLParserWrapper(xbrl_path, "dom").get_record())